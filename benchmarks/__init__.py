@@ -0,0 +1,19 @@
+"""Бенчмарки Yatube. Запускаются как модули из корня проекта:
+
+    python -m benchmarks.explain --posts 1000000
+    python -m benchmarks.views --posts 1000000 --out results.json
+    python -m benchmarks.compare baseline.json results.json
+    python -m benchmarks.concurrency --threads 8 --duration 10
+"""
+import os
+import sys
+
+
+def setup(db_path):
+    """Настраивает Django на отдельную базу db_path (не на db.sqlite3)."""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = db_path
+    import django
+    django.setup()
@@ -0,0 +1,42 @@
+"""Сравнение двух прогонов benchmarks.views.
+
+    python -m benchmarks.compare baseline.json results.json --threshold 0.2
+
+Код выхода 1, если p50 какой-то view вырос больше порога или выросло
+число запросов.
+"""
+import argparse
+import json
+import sys
+
+
+def compare(baseline, current, threshold):
+    regressions = []
+    for name, new in current['views'].items():
+        old = baseline['views'].get(name)
+        if old is None:
+            print(f'{name:<14} новая view')
+            continue
+        change = (new['p50_ms'] - old['p50_ms']) / old['p50_ms'] if old['p50_ms'] else 0
+        print(f"{name:<14} p50 {old['p50_ms']:8.2f} -> {new['p50_ms']:8.2f} ms "
+              f"({change:+.0%})  queries {old['queries']} -> {new['queries']}")
+        if change > threshold or new['queries'] > old['queries']:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+    with open(args.baseline) as baseline, open(args.current) as current:
+        regressions = compare(json.load(baseline), json.load(current), args.threshold)
+    if regressions:
+        print('Регрессии: ' + ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
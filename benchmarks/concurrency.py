@@ -0,0 +1,163 @@
+"""Смешанная нагрузка чтения и записи из нескольких потоков.
+
+    python -m benchmarks.concurrency --threads 8 --duration 10 --write-ratio 0.2
+
+Один и тот же сценарий прогоняется дважды на одной базе:
+
+    baseline   — настройки SQLite по умолчанию (rollback journal,
+                 synchronous=full), новое соединение на каждый запрос,
+                 без повторов при «database is locked»;
+    production — SQLITE_PRAGMAS, CONN_MAX_AGE и retry_on_busy из settings.
+
+Тестовый клиент не закрывает соединения сам, поэтому после каждого
+запроса вызывается close_old_connections — как это делает обработчик
+request_finished на настоящем сервере.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+from benchmarks import setup
+from benchmarks.views import percentile
+
+BASELINE = {
+    'pragmas': {'journal_mode': 'delete', 'synchronous': 'full'},
+    'conn_max_age': 0,
+    'retries': 0,
+}
+
+
+def configure(config):
+    from django.conf import settings
+    from django.db import connection, connections
+
+    connections.close_all()
+    settings.SQLITE_PRAGMAS = config['pragmas']
+    settings.DATABASES['default']['CONN_MAX_AGE'] = config['conn_max_age']
+    settings.SQLITE_BUSY_RETRIES = config['retries']
+    # режим журнала переключается, пока других соединений нет
+    connection.ensure_connection()
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        return cursor.fetchone()[0]
+
+
+def worker(user, post, deadline, write_ratio, seed, results):
+    from django.db import DatabaseError, close_old_connections
+    from django.test import Client
+    from django.urls import reverse
+
+    rng = random.Random(seed)
+    client = Client()
+    client.force_login(user)
+    reads = [
+        reverse('index'),
+        reverse('post', args=(post.author.username, post.pk)),
+        reverse('profile', args=(post.author.username,)),
+    ]
+    comment_url = reverse('add_comment', args=(post.author.username, post.pk))
+    while time.perf_counter() < deadline:
+        write = rng.random() < write_ratio
+        started = time.perf_counter()
+        try:
+            if write:
+                response = client.post(comment_url, {'text': 'Комментарий под нагрузкой'})
+            else:
+                response = client.get(rng.choice(reads))
+            ok = response.status_code < 400
+        except DatabaseError:
+            ok = False
+        finally:
+            close_old_connections()
+        results.append((write, ok, (time.perf_counter() - started) * 1000))
+
+
+def run(config, threads, duration, write_ratio):
+    from django.contrib.auth import get_user_model
+    from django.db import connections
+
+    from posts.models import Post
+
+    journal = configure(config)
+    users = list(get_user_model().objects.order_by('?')[:threads])
+    post = Post.objects.select_related('author').order_by('-pk').first()
+    results = []
+    deadline = time.perf_counter() + duration
+    pool = [
+        threading.Thread(
+            target=worker,
+            args=(users[i % len(users)], post, deadline, write_ratio, i, results),
+        )
+        for i in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    connections.close_all()
+
+    done = [r for r in results if r[1]]
+    timings = [r[2] for r in done] or [0]
+    return {
+        'journal_mode': journal,
+        'requests_per_s': len(done) / duration,
+        'reads_per_s': sum(1 for r in done if not r[0]) / duration,
+        'writes_per_s': sum(1 for r in done if r[0]) / duration,
+        'errors': len(results) - len(done),
+        'p50_ms': percentile(timings, 50),
+        'p99_ms': percentile(timings, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--db', help='готовая база (без генерации данных)')
+    parser.add_argument('--out', help='куда записать JSON с результатами')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    setup(db_path)
+    # ошибки baseline и предупреждения о бюджете запросов считаем, а не печатаем
+    logging.disable(logging.CRITICAL)
+
+    from django.conf import settings
+    from django.core.management import call_command
+
+    from benchmarks.seed import seed_dataset
+
+    modes = {
+        'baseline': BASELINE,
+        'production': {
+            'pragmas': dict(settings.SQLITE_PRAGMAS),
+            'conn_max_age': settings.DATABASES['default']['CONN_MAX_AGE'],
+            'retries': settings.SQLITE_BUSY_RETRIES,
+        },
+    }
+    if not args.db:
+        call_command('migrate', verbosity=0)
+        seed_dataset(users=max(args.threads, 100), groups=10, posts=args.posts,
+                     comments=args.posts, follows_per_user=10)
+
+    results = {}
+    for mode, config in modes.items():
+        results[mode] = row = run(config, args.threads, args.duration, args.write_ratio)
+        print(f"{mode:<11} {row['journal_mode']:<7} {row['requests_per_s']:8.1f} req/s  "
+              f"reads {row['reads_per_s']:7.1f}/s  writes {row['writes_per_s']:6.1f}/s  "
+              f"errors {row['errors']:4d}  p50 {row['p50_ms']:7.2f} ms  "
+              f"p99 {row['p99_ms']:8.2f} ms")
+    if args.out:
+        with open(args.out, 'w') as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Планы запросов лент до и после составных индексов (0011_feed_indexes).
+
+    python -m benchmarks.explain --posts 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks import setup
+
+BEFORE = '0010_user_counters'
+
+
+def feed_queries():
+    from django.contrib.auth import get_user_model
+
+    from groups.models import Group
+    from posts.models import Comments, Follow, Post
+
+    user = get_user_model().objects.order_by('pk').first()
+    author = get_user_model().objects.order_by('-pk').first()
+    group = Group.objects.order_by('pk').first()
+    middle = Post.objects.order_by('pk').values_list('pub_date', flat=True)[
+        Post.objects.count() // 2
+    ]
+    return {
+        'index': Post.objects.for_feed()[:10],
+        'index, deep cursor': Post.objects.for_feed().filter(pub_date__lt=middle)[:10],
+        'group_posts': Post.objects.for_feed().filter(group=group)[:10],
+        'profile': Post.objects.for_feed().filter(author=author)[:10],
+        'post_view comments': Comments.objects.filter(post_id=1)[:20],
+        'follow check': Follow.objects.filter(user=user, author=author),
+    }
+
+
+def explain_all():
+    plans = {}
+    for name, queryset in feed_queries().items():
+        started = time.perf_counter()
+        list(queryset)
+        elapsed = time.perf_counter() - started
+        plans[name] = (queryset.explain(), elapsed)
+    return plans
+
+
+def report(title, plans):
+    print(f'=== {title}')
+    for name, (plan, elapsed) in plans.items():
+        print(f'--- {name}: {elapsed * 1000:.1f} ms')
+        print(plan)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--groups', type=int, default=100)
+    parser.add_argument('--db', help='файл базы (по умолчанию временный)')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'explain.sqlite3')
+    setup(db_path)
+
+    from django.core.management import call_command
+    from django.db import connection
+
+    from benchmarks.seed import seed_dataset
+
+    call_command('migrate', verbosity=0)
+    call_command('migrate', 'posts', BEFORE, verbosity=0)
+    started = time.perf_counter()
+    seed_dataset(users=args.users, groups=args.groups, posts=args.posts)
+    print(f'Seeded {args.posts} posts in {time.perf_counter() - started:.1f} s')
+    report('before', explain_all())
+
+    call_command('migrate', 'posts', verbosity=0)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    report('after', explain_all())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Генератор синтетических данных.
+
+Посты и комментарии вставляются пачками сырым executemany: bulk_create
+перезаписал бы pub_date и created из-за auto_now_add, а даты нам нужны
+разные. Сигналы при этом не срабатывают, поэтому finish() достраивает
+поисковый индекс и счётчики; лента подписок читает такие посты
+гибридно (fanned_out=False).
+"""
+import io
+import random
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+
+BATCH_SIZE = 10000
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(model, columns, rows):
+    table = connection.ops.quote_name(model._meta.db_table)
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        table,
+        ', '.join(connection.ops.quote_name(c) for c in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    with connection.cursor() as cursor:
+        for batch in _batches(rows):
+            with transaction.atomic():
+                cursor.executemany(sql, batch)
+
+
+def seed_users(count):
+    User = get_user_model()
+    start = User.objects.count()
+    User.objects.bulk_create(
+        (User(username=f'user_{start + i}') for i in range(count)),
+        batch_size=BATCH_SIZE,
+    )
+    return list(User.objects.values_list('pk', flat=True))
+
+
+def seed_groups(count):
+    from groups.models import Group
+    start = Group.objects.count()
+    Group.objects.bulk_create(
+        Group(title=f'Группа {start + i}', slug=f'group-{start + i}', description='-')
+        for i in range(count)
+    )
+    return list(Group.objects.values_list('pk', flat=True))
+
+
+def seed_posts(count, user_ids, group_ids, seed=0):
+    from posts.models import Post
+    rnd = random.Random(seed)
+    now = timezone.now()
+    rows = (
+        (
+            f'Пост номер {i}',
+            now - timedelta(seconds=count - i),
+            rnd.choice(user_ids),
+            rnd.choice(group_ids) if group_ids and rnd.random() < 0.5 else None,
+            '',
+            False,
+        )
+        for i in range(count)
+    )
+    _insert(
+        Post,
+        ('text', 'pub_date', 'author_id', 'group_id', 'image', 'fanned_out'),
+        rows,
+    )
+
+
+def seed_comments(count, user_ids, seed=0):
+    from posts.models import Comments, Post
+    rnd = random.Random(seed)
+    now = timezone.now()
+    last_post = Post.objects.order_by('-pk').values_list('pk', flat=True).first()
+    if not last_post:
+        return
+    rows = (
+        (
+            rnd.randint(1, last_post),
+            rnd.choice(user_ids),
+            f'Комментарий {i}',
+            now - timedelta(seconds=count - i),
+        )
+        for i in range(count)
+    )
+    _insert(Comments, ('post_id', 'author_id', 'text', 'created'), rows)
+
+
+def seed_follows(per_user, user_ids, seed=0):
+    from posts.models import Follow
+    rnd = random.Random(seed)
+    per_user = min(per_user, len(user_ids) - 1)
+
+    def rows():
+        for user_id in user_ids:
+            authors = [a for a in rnd.sample(user_ids, per_user + 1) if a != user_id]
+            for author_id in authors[:per_user]:
+                yield user_id, author_id
+
+    columns = ('user_id', 'author_id')
+    table = connection.ops.quote_name(Follow._meta.db_table)
+    sql = 'INSERT OR IGNORE INTO {} ({}) VALUES (%s, %s)'.format(
+        table, ', '.join(columns)
+    )
+    with connection.cursor() as cursor:
+        for batch in _batches(rows()):
+            with transaction.atomic():
+                cursor.executemany(sql, batch)
+
+
+def finish():
+    """Достраивает производные данные, которые сигналы бы заполнили сами."""
+    from django.core.management import call_command
+
+    from posts import search
+    from posts.models import Post
+    with connection.cursor() as cursor:
+        # explain.py засевает схему до 0012_post_search, там FTS ещё нет
+        fts = search.FTS_TABLE in connection.introspection.table_names(cursor)
+        if search.available() and fts:
+            cursor.execute(f'DELETE FROM {search.FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {search.FTS_TABLE} (rowid, text) '
+                f'SELECT id, text FROM {Post._meta.db_table}'
+            )
+        cursor.execute('ANALYZE')
+    call_command('recount_counters', stdout=io.StringIO())
+
+
+def seed_dataset(users=1000, groups=50, posts=100000, comments=0,
+                 follows_per_user=0, seed=0):
+    user_ids = seed_users(users)
+    group_ids = seed_groups(groups)
+    seed_posts(posts, user_ids, group_ids, seed=seed)
+    seed_comments(comments, user_ids, seed=seed)
+    seed_follows(follows_per_user, user_ids, seed=seed)
+    finish()
@@ -0,0 +1,162 @@
+"""Замеры view через тестовый клиент на синтетических данных.
+
+    python -m benchmarks.views --posts 1000000 --out results.json
+    python -m benchmarks.compare baseline.json results.json
+
+Для каждой view сохраняются перцентили времени ответа и число SQL
+запросов, результаты пишутся в JSON для сравнения между прогонами.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+from benchmarks import setup
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def scenarios():
+    """Пары (имя, функция запроса) для замера."""
+    from django.contrib.auth import get_user_model
+    from django.urls import reverse
+
+    from groups.models import Group
+    from posts.models import Follow, Post
+
+    User = get_user_model()
+    reader_id = (
+        Follow.objects.values_list('user_id', flat=True).order_by('user_id').first()
+        or User.objects.order_by('pk').values_list('pk', flat=True).first()
+    )
+    reader = User.objects.get(pk=reader_id)
+    post = Post.objects.select_related('author').order_by('-pk').first()
+    group = Group.objects.order_by('pk').first()
+
+    def client():
+        from django.test import Client
+        c = Client()
+        c.force_login(reader)
+        return c
+
+    c = client()
+    return [
+        ('index', lambda: c.get(reverse('index'))),
+        ('group_posts', lambda: c.get(reverse('group', args=(group.slug,)))),
+        ('profile', lambda: c.get(reverse('profile', args=(post.author.username,)))),
+        ('post_view', lambda: c.get(
+            reverse('post', args=(post.author.username, post.pk)))),
+        ('follow_index', lambda: c.get(reverse('follow_index'))),
+        ('add_comment', lambda: c.post(
+            reverse('add_comment', args=(post.author.username, post.pk)),
+            {'text': 'Комментарий из бенчмарка'})),
+    ]
+
+
+def measure(request, repeat, warmup, cold):
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    for _ in range(warmup):
+        request()
+    timings, queries = [], []
+    for _ in range(repeat):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = request()
+            timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f'HTTP {response.status_code}')
+        queries.append(len(captured))
+    return {
+        'p50_ms': percentile(timings, 50),
+        'p90_ms': percentile(timings, 90),
+        'p99_ms': percentile(timings, 99),
+        'mean_ms': statistics.mean(timings),
+        'max_ms': max(timings),
+        'queries': max(queries),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--comments', type=int, default=100000)
+    parser.add_argument('--follows', type=int, default=50,
+                        help='подписок на пользователя')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--cold', action='store_true',
+                        help='очищать кэш перед каждым запросом')
+    parser.add_argument('--db', help='готовая база (без генерации данных)')
+    parser.add_argument('--out', help='куда записать JSON с результатами')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    setup(db_path)
+
+    from django.core.management import call_command
+
+    from benchmarks.seed import seed_dataset
+
+    if not args.db:
+        call_command('migrate', verbosity=0)
+        started = time.perf_counter()
+        seed_dataset(
+            users=args.users, groups=args.groups, posts=args.posts,
+            comments=args.comments, follows_per_user=args.follows,
+        )
+        print(f'Seeded in {time.perf_counter() - started:.1f} s')
+
+    results = {}
+    for name, request in scenarios():
+        results[name] = measure(request, args.repeat, args.warmup, args.cold)
+        row = results[name]
+        print(f"{name:<14} p50 {row['p50_ms']:8.2f} ms  p90 {row['p90_ms']:8.2f} ms  "
+              f"p99 {row['p99_ms']:8.2f} ms  queries {row['queries']}")
+
+    if args.out:
+        report = {
+            'meta': {
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'timestamp': time.time(),
+                'volumes': {
+                    'users': args.users, 'groups': args.groups,
+                    'posts': args.posts, 'comments': args.comments,
+                    'follows_per_user': args.follows,
+                },
+                'repeat': args.repeat,
+                'cold': args.cold,
+            },
+            'views': results,
+        }
+        with open(args.out, 'w') as out:
+            json.dump(report, out, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
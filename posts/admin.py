@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Post, Comments, Follow
+from . import search
 # Register your models here.
 
 
@@ -9,6 +10,12 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        # ищем по полнотекстовому индексу, а не LIKE по всей таблице
+        if not search_term:
+            return queryset, False
+        return search.search(queryset, search_term), False
+
 class CommentsAdmin(admin.ModelAdmin):
     list_display = ("post","author", "text", "created")
     search_fields = ("text",)
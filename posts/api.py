@@ -0,0 +1,122 @@
+"""JSON API лент и поста только для чтения.
+
+Строки отдаются через values(), без создания моделей; страницы — по
+курсору (?cursor=), как в posts.pagination. Ответы несут ETag и
+Last-Modified (posts.conditional), неизменившаяся лента — 304.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_safe
+
+from groups.models import Group
+
+from . import conditional, timeline
+from .models import Comments, Post, User
+from .pagination import CursorPaginator
+
+POST_FIELDS = (
+    'id', 'text', 'pub_date', 'author__username', 'group__slug', 'image',
+    'comment_count',
+)
+COMMENT_FIELDS = ('id', 'text', 'created', 'author__username')
+
+
+def api_view(validators, login=False):
+    """GET/HEAD, проверка входа и условный ответ по validators."""
+    def decorator(view):
+        view = conditional.conditional(validators)(view)
+
+        @require_safe
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if login and not request.user.is_authenticated:
+                return JsonResponse({'detail': 'Требуется вход'}, status=401)
+            response = view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
+
+
+def image_url(name):
+    # хранилище поля (адресация по содержимому), а не default_storage
+    return Post._meta.get_field('image').storage.url(name) if name else None
+
+
+def serialize_post(row):
+    return {
+        'id': row['id'],
+        'text': row['text'],
+        'pub_date': row['pub_date'],
+        'author': row['author__username'],
+        'group': row['group__slug'],
+        'image': image_url(row['image']),
+        'comment_count': row['comment_count'] or 0,
+    }
+
+
+def serialize_comment(row):
+    return {
+        'id': row['id'],
+        'text': row['text'],
+        'created': row['created'],
+        'author': row['author__username'],
+    }
+
+
+def page_data(page, serialize):
+    return {
+        'results': [serialize(row) for row in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+def feed_response(request, queryset):
+    paginator = CursorPaginator(queryset.values(*POST_FIELDS), settings.POSTS_PER_PAGE)
+    page = paginator.get_page(request.GET.get('cursor'))
+    return JsonResponse(page_data(page, serialize_post))
+
+
+@api_view(conditional.index)
+def index(request):
+    return feed_response(request, Post.objects.for_feed())
+
+
+@api_view(conditional.group)
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return feed_response(request, Post.objects.for_feed().filter(group=group))
+
+
+@api_view(conditional.profile, login=True)
+def profile(request, username):
+    author = get_object_or_404(User, username=username)
+    return feed_response(request, Post.objects.for_feed().filter(author=author))
+
+
+@api_view(conditional.follow, login=True)
+def follow_index(request):
+    return feed_response(request, timeline.feed(request.user))
+
+
+@api_view(conditional.post, login=True)
+def post_view(request, username, post_id):
+    post = get_object_or_404(
+        Post.objects.for_feed().values(*POST_FIELDS),
+        pk=post_id, author__username=username,
+    )
+    comments = CursorPaginator(
+        Comments.objects.filter(post_id=post_id).values(*COMMENT_FIELDS),
+        settings.COMMENTS_PER_PAGE, field='created',
+    )
+    page = comments.get_page(request.GET.get('cursor'))
+    return JsonResponse({
+        'post': serialize_post(post),
+        'comments': page_data(page, serialize_comment),
+    })
@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from yatube.sqlite import configure_connection
+
+        from . import signals  # noqa: F401
+        connection_created.connect(configure_connection)
@@ -0,0 +1,121 @@
+"""Кэш целых страниц лент для анонимных посетителей.
+
+Ключ страницы включает версию ленты (index, group:<slug>). Версия
+меняется при сохранении, удалении поста или комментария в этой ленте,
+так что инвалидация точная и не зависит от срока жизни кэша. Версии
+author:<username> (лента профиля) и follow:<username> (подписки
+пользователя и на него) страницы не кэшируют, по ним строятся ETag (см.
+posts.conditional). Имена, а не id — чтобы валидатор считался по адресу
+страницы без запроса к базе.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from .middleware import record_cache
+
+FEED_VERSION_KEY = 'feed_version:{}'
+PAGE_KEY = 'feed_page:{}:{}:{}'
+
+
+def get_version(key):
+    value = cache.get(key)
+    if value is None:
+        # версия потерялась (вытеснение): новая, ещё не встречавшаяся
+        cache.add(key, time.time_ns(), timeout=None)
+        value = cache.get(key)
+    return value
+
+
+def bump_version(key):
+    cache.set(key, time.time_ns(), timeout=None)
+
+
+def next_version(key):
+    """Атомарно увеличивает версию и возвращает новую."""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        get_version(key)
+        return cache.incr(key)
+
+
+def feed_version(scope):
+    return get_version(FEED_VERSION_KEY.format(scope))
+
+
+def _usernames(user_ids):
+    from django.contrib.auth import get_user_model
+    user_ids = [pk for pk in user_ids if pk]
+    if not user_ids:
+        return []
+    users = get_user_model().objects.filter(pk__in=user_ids)
+    return users.values_list('username', flat=True)
+
+
+def feed_scopes(group_ids=(), author_ids=()):
+    from groups.models import Group
+    slugs = Group.objects.filter(pk__in=[pk for pk in group_ids if pk])
+    return (
+        ['index']
+        + [f'group:{slug}' for slug in slugs.values_list('slug', flat=True)]
+        + [f'author:{username}' for username in _usernames(author_ids)]
+    )
+
+
+def invalidate_scopes(scopes):
+    for scope in scopes:
+        bump_version(FEED_VERSION_KEY.format(scope))
+
+
+def invalidate_feeds(group_ids=(), author_ids=()):
+    invalidate_scopes(feed_scopes(group_ids, author_ids))
+
+
+def invalidate_follows(*user_ids):
+    for username in _usernames(user_ids):
+        bump_version(FEED_VERSION_KEY.format(f'follow:{username}'))
+
+
+def cache_anonymous_page(scope):
+    """Кэширует ответ для анонимных GET-запросов.
+
+    scope — шаблон имени ленты, подставляются аргументы view:
+    'index', 'group:{slug}'.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            anonymous = (
+                request.method in ('GET', 'HEAD')
+                and not request.user.is_authenticated
+            )
+            if not anonymous:
+                response = view(request, *args, **kwargs)
+                patch_cache_control(response, private=True)
+                patch_vary_headers(response, ('Cookie',))
+                return response
+
+            name = scope.format(**kwargs)
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = PAGE_KEY.format(
+                name, feed_version(name), path
+            )
+            response = cache.get(key)
+            record_cache(response is not None)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                # ответы с cookie (csrf, сессия) не должны попасть другим
+                if response.status_code == 200 and not response.cookies:
+                    cache.set(key, response, settings.FEED_PAGE_CACHE_TIMEOUT)
+            patch_cache_control(
+                response, public=True, max_age=settings.FEED_PAGE_MAX_AGE
+            )
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
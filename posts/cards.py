@@ -0,0 +1,151 @@
+"""Кэш отрендеренных карточек постов (post_item.html).
+
+Ключ карточки — id поста плюс версии поста, автора и группы. Версия
+поста меняется при каждом его сохранении и при добавлении или удалении
+комментария, версия автора — при смене имени, группы — при её правке
+(имя автора, название и slug группы выводятся в карточке), поэтому
+устаревшая карточка никогда не отдаётся. Кнопка «Редактировать» зависит
+от зрителя и подставляется вместо EDIT_MARKER уже после кэша.
+
+Шаблон карточки разрешается один раз на процесс, а в ленте рендерится
+в контексте страницы (push/pop), без нового Context на каждый пост.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.dispatch import receiver
+from django.template import Context
+from django.template.loader import get_template
+from django.utils.autoreload import file_changed
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from .caching import bump_version, get_version
+from .middleware import record_cache
+
+EDIT_MARKER = '<!--post-edit-->'
+VERSION_KEY = 'post_card_version:{}'
+AUTHOR_VERSION_KEY = 'post_card_author_version:{}'
+GROUP_VERSION_KEY = 'post_card_group_version:{}'
+CARD_KEY = 'post_card:{}:{}'
+STATS_KEY = 'post_card_stats:{}'
+
+
+def version(post_id):
+    return get_version(VERSION_KEY.format(post_id))
+
+
+def bump(post_id):
+    bump_version(VERSION_KEY.format(post_id))
+
+
+def bump_author(user_id):
+    bump_version(AUTHOR_VERSION_KEY.format(user_id))
+
+
+def bump_group(group_id):
+    bump_version(GROUP_VERSION_KEY.format(group_id))
+
+
+def _version_keys(post):
+    keys = [VERSION_KEY.format(post.pk), AUTHOR_VERSION_KEY.format(post.author_id)]
+    if post.group_id:
+        keys.append(GROUP_VERSION_KEY.format(post.group_id))
+    return keys
+
+
+def card_key(post, versions=None):
+    """Ключ карточки; versions — уже прочитанные версии {ключ: версия}."""
+    versions = versions or {}
+    parts = [versions.get(key) or get_version(key) for key in _version_keys(post)]
+    return CARD_KEY.format(post.pk, '.'.join(map(str, parts)))
+
+
+def _count(event, delta=1):
+    # счётчики общие для всех воркеров: card_cache_stats видит их сумму
+    stats_cache = caches[settings.STATS_CACHE]
+    key = STATS_KEY.format(event)
+    stats_cache.add(key, 0, timeout=None)
+    try:
+        stats_cache.incr(key, delta)
+    except ValueError:
+        pass
+
+
+def stats():
+    stats_cache = caches[settings.STATS_CACHE]
+    hits = stats_cache.get(STATS_KEY.format('hits'), 0)
+    misses = stats_cache.get(STATS_KEY.format('misses'), 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+    }
+
+
+def edit_link(post):
+    return format_html(
+        '<a class="btn btn-sm text-muted" href="{}" role="button">'
+        'Редактировать</a>',
+        reverse('post_edit', args=(post.author.username, post.pk)),
+    )
+
+
+@lru_cache(maxsize=None)
+def template():
+    return get_template('post_item.html').template
+
+
+@receiver(file_changed)
+def _template_changed(sender, file_path, **kwargs):
+    # правка шаблона в разработке: загрузчики сбросит Django, карточку — мы
+    if file_path.suffix == '.html':
+        template.cache_clear()
+
+
+def prefetch(posts):
+    """Ключи и готовые карточки страницы: {pk: (key, html или None)}.
+
+    Версии и карточки читаются двумя get_many вместо двух обращений к
+    кэшу на каждый пост; для промахов превью подгружаются одной пачкой.
+    """
+    posts = list(posts)
+    versions = cache.get_many(list({
+        key for post in posts for key in _version_keys(post)
+    }))
+    keys = {post.pk: card_key(post, versions) for post in posts}
+    found = cache.get_many(list(keys.values()))
+    result = {pk: (key, found.get(key)) for pk, key in keys.items()}
+    misses = [post for post in posts if result[post.pk][1] is None]
+    if misses:
+        from . import thumbnails
+        thumbnails.prefetch(misses)
+    _count('hits', len(posts) - len(misses))
+    _count('misses', len(misses))
+    return result
+
+
+def render(post, user=None, context=None, prefetched=None):
+    """Карточка поста; context — контекст страницы, если рендерим из ленты,
+    prefetched — (ключ, html) из prefetch()."""
+    if prefetched is None:
+        key = card_key(post)
+        html = cache.get(key)
+        _count('misses' if html is None else 'hits')
+    else:
+        key, html = prefetched
+    record_cache(html is not None)
+    if html is None:
+        if context is None:
+            html = template().render(Context({'post': post}))
+        else:
+            # post_item.html зависит только от post, так что кэшировать
+            # результат, отрендеренный в чужом контексте, безопасно
+            with context.push(post=post):
+                html = template().render(context)
+        cache.set(key, html, settings.POST_CARD_CACHE_TIMEOUT)
+    owner = user is not None and user.pk == post.author_id
+    return mark_safe(html.replace(EDIT_MARKER, edit_link(post) if owner else ''))
@@ -0,0 +1,115 @@
+"""Валидаторы условных GET (ETag, Last-Modified) для лент и поста.
+
+ETag строится из версий лент (см. posts.caching) и адреса запроса, для
+JSON API — ещё из даты самого свежего поста или комментария. Всё это
+считается до view: версии лежат в общем для всех воркеров кэше (правка
+в одном процессе меняет ETag во всех), дата — один запрос по индексу,
+поэтому неизменившаяся страница отвечает 304 без выборки и без рендера.
+HTML-страницы обходятся одними версиями, как и кэш страниц для анонимов:
+повторный запрос с If-None-Match не трогает базу вовсе.
+"""
+import hashlib
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db.models import Max
+from django.views.decorators.http import condition
+
+from . import cards
+from .caching import feed_version
+from .models import Comments, Post
+
+
+def version_time(version):
+    # версии — time.time_ns() в момент изменения
+    return datetime.fromtimestamp(version / 1e9, tz=timezone.utc)
+
+
+def newest(queryset, field='pub_date'):
+    return queryset.order_by().aggregate(newest=Max(field))['newest']
+
+
+def build(request, versions, dates=(), extra=()):
+    """(etag, last_modified) по версиям, датам и адресу запроса."""
+    dates = [date for date in dates if date is not None]
+    last_modified = max(dates + [version_time(v) for v in versions])
+    raw = repr((versions, dates, request.get_full_path(), extra))
+    return hashlib.sha1(raw.encode()).hexdigest(), last_modified
+
+
+# Валидаторы принимают аргументы view; dates=False — только версии
+
+def index(request, dates=True, **kwargs):
+    return build(
+        request, [feed_version('index')],
+        [newest(Post.objects.all())] if dates else (),
+    )
+
+
+def group(request, slug, dates=True, **kwargs):
+    return build(
+        request, [feed_version(f'group:{slug}')],
+        [newest(Post.objects.filter(group__slug=slug))] if dates else (),
+    )
+
+
+def profile(request, username, dates=True, **kwargs):
+    # follow:<username> — число подписчиков и подписок в шапке профиля
+    return build(
+        request, [feed_version(f'author:{username}'), feed_version(f'follow:{username}')],
+        [newest(Post.objects.filter(author__username=username))] if dates else (),
+    )
+
+
+def follow(request, dates=True, **kwargs):
+    # в ленту подписок попадает любой новый пост, поэтому версия index
+    return build(request, [
+        feed_version('index'), feed_version(f'follow:{request.user.username}'),
+    ])
+
+
+def post(request, username, post_id, dates=True, **kwargs):
+    # версия карточки меняется при правке поста и любом комментарии,
+    # версии автора — для его счётчиков рядом с постом
+    comments = Comments.objects.filter(post_id=post_id)
+    return build(
+        request, [
+            cards.version(post_id), feed_version(f'author:{username}'),
+            feed_version(f'follow:{username}'),
+        ],
+        [newest(comments, 'created')] if dates else (),
+    )
+
+
+def for_viewer(validators):
+    """Валидаторы HTML-страницы: только версии и ещё зритель.
+
+    Меню и кнопка «Редактировать» зависят от пользователя, «Подписаться» —
+    от его подписок, форма комментария — от csrf-cookie.
+    """
+    def wrapper(request, *args, **kwargs):
+        etag, last_modified = validators(request, *args, dates=False, **kwargs)
+        viewer = (request.user.pk, request.COOKIES.get(settings.CSRF_COOKIE_NAME))
+        if request.user.is_authenticated:
+            version = feed_version(f'follow:{request.user.username}')
+            viewer += (version,)
+            last_modified = max(last_modified, version_time(version))
+        etag = hashlib.sha1(repr((etag, viewer)).encode()).hexdigest()
+        return etag, last_modified
+    return wrapper
+
+
+def conditional(validators):
+    """condition() с одним вычислением validators на запрос."""
+    def cached(request, *args, **kwargs):
+        if not hasattr(request, '_validators'):
+            request._validators = validators(request, *args, **kwargs)
+        return request._validators
+
+    def etag(request, *args, **kwargs):
+        return cached(request, *args, **kwargs)[0]
+
+    def last_modified(request, *args, **kwargs):
+        return cached(request, *args, **kwargs)[1]
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
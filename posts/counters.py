@@ -0,0 +1,72 @@
+"""Денормализованные счётчики постов и подписок пользователя.
+
+Счётчики меняются атомарно через F() при создании и удалении Post и
+Follow. Строка, которой ещё нет, пересчитывается из таблиц при первом
+обращении; расхождения чинит команда recount_counters. Уменьшение не
+опускает счётчик ниже нуля: разошедшийся с таблицами счётчик не должен
+ломать отписку и удаление поста.
+"""
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import Follow, Post, User, UserCounters
+
+COUNTERS = ('posts', 'followers', 'following')
+
+
+def bump(user_id, field, delta):
+    updated = UserCounters.objects.filter(user_id=user_id).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+    # при уменьшении строки может уже не быть (удаляется сам пользователь),
+    # её пересчитает for_user() при следующем чтении
+    if not updated and delta > 0:
+        recount([user_id])
+
+
+def count(user_ids, using=DEFAULT_DB_ALIAS):
+    """Фактические значения счётчиков по таблицам для пачки пользователей."""
+    result = {pk: dict.fromkeys(COUNTERS, 0) for pk in user_ids}
+    queries = (
+        ('posts', Post.objects.using(using).filter(author__in=user_ids), 'author'),
+        ('followers', Follow.objects.using(using).filter(author__in=user_ids), 'author'),
+        ('following', Follow.objects.using(using).filter(user__in=user_ids), 'user'),
+    )
+    for field, queryset, key in queries:
+        rows = queryset.order_by().values(key).annotate(total=Count('pk'))
+        for row in rows:
+            result[row[key]][field] = row['total']
+    return result
+
+
+def recount(user_ids):
+    """Пересчитывает счётчики, возвращает число исправленных строк."""
+    # всё в основной базе: реплика в GET может отставать, а bulk_create
+    # Django 4.1 выбирает базу роутером чтения
+    users = User.objects.using(DEFAULT_DB_ALIAS).filter(pk__in=user_ids)
+    user_ids = list(users.values_list('pk', flat=True))
+    actual = count(user_ids)
+    objects = UserCounters.objects.using(DEFAULT_DB_ALIAS)
+    existing = objects.in_bulk(user_ids)
+    to_create, to_update = [], []
+    for user_id, values in actual.items():
+        counters = existing.get(user_id)
+        if counters is None:
+            to_create.append(UserCounters(user_id=user_id, **values))
+        elif any(getattr(counters, f) != v for f, v in values.items()):
+            for field, value in values.items():
+                setattr(counters, field, value)
+            to_update.append(counters)
+    objects.bulk_create(to_create, ignore_conflicts=True)
+    objects.bulk_update(to_update, COUNTERS)
+    return len(to_create) + len(to_update)
+
+
+def for_user(user):
+    try:
+        return UserCounters.objects.get(user_id=user.pk)
+    except UserCounters.DoesNotExist:
+        recount([user.pk])
+        # строка только что записана в основную базу, на реплике её ещё нет
+        return UserCounters.objects.using(DEFAULT_DB_ALIAS).get(user_id=user.pk)
@@ -0,0 +1,68 @@
+"""Потоковая выгрузка постов и комментариев пользователя.
+
+Строки читаются из базы порциями через iterator() (без кэша queryset и
+без создания моделей) и сразу превращаются в NDJSON или CSV, так что
+память не зависит от объёма истории.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Comments, Post
+
+COLUMNS = ('type', 'id', 'date', 'text', 'group', 'image', 'post')
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def rows(user):
+    posts = (
+        Post.objects.filter(author=user).order_by('pk')
+        .values_list('pk', 'pub_date', 'text', 'group__slug', 'image')
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+    for pk, pub_date, text, group, image in posts:
+        yield {
+            'type': 'post', 'id': pk, 'date': pub_date, 'text': text,
+            'group': group, 'image': image or None, 'post': None,
+        }
+    comments = (
+        Comments.objects.filter(author=user).order_by('pk')
+        .values_list('pk', 'created', 'text', 'post_id')
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+    for pk, created, text, post_id in comments:
+        yield {
+            'type': 'comment', 'id': pk, 'date': created, 'text': text,
+            'group': None, 'image': None, 'post': post_id,
+        }
+
+
+def ndjson_lines(user):
+    for row in rows(user):
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    # csv.writer пишет в «файл», а мы сразу отдаём строку наружу
+    def write(self, value):
+        return value
+
+
+def csv_lines(user):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows(user):
+        yield writer.writerow(
+            '' if row[column] is None else row[column] for column in COLUMNS
+        )
+
+
+def lines(user, export_format):
+    if export_format == 'csv':
+        return csv_lines(user)
+    return ndjson_lines(user)
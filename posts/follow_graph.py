@@ -0,0 +1,233 @@
+"""Граф подписок в памяти процесса.
+
+Для каждого пользователя хранятся отсортированные массивы id: на кого он
+подписан и кто подписан на него. Проверка подписки — бинарный поиск,
+списки отдаются без запросов к базе. Граф загружается из Follow целиком
+при старте (см. yatube/wsgi.py) или при первом обращении, а сигналы
+подписки и отписки правят его на месте.
+
+Каждая правка атомарно увеличивает поколение графа в общем кэше и
+записывает туда же саму правку. Процесс, чьё поколение отстало, при
+следующем обращении применяет пропущенные правки из кэша, а если их там
+уже нет (истекли, вытеснены) — перечитывает граф. Граф всё равно служит
+только для показа (кнопка подписки, списки), а рассылка и лента
+подписок читают Follow из базы (см. posts.timeline).
+
+Каждый процесс публикует в кэше отпечаток своего графа: поколение, число
+подписок и XOR хэшей пар. По ним check_follow_graph сверяет с базой
+графы работающих процессов, а не свой собственный.
+
+В граф попадают только закоммиченные подписки: правки применяются в
+on_commit, а граф, прочитанный внутри транзакции, не запоминается.
+"""
+import os
+import socket
+import threading
+import uuid
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .caching import get_version, next_version
+from .models import Follow
+
+GENERATION_KEY = 'follow_graph:generation'
+CHANGE_KEY = 'follow_graph:change:{}'
+PROCESSES_KEY = 'follow_graph:processes'
+PROCESS_KEY = 'follow_graph:process:{}'
+# журнал правок для отставших процессов; отставший сильнее перечитывает граф
+CHANGE_TIMEOUT = 24 * 60 * 60
+CATCH_UP_LIMIT = 1000
+# отпечаток процесса, который давно не обращался к графу, исчезает
+PROCESS_TIMEOUT = 24 * 60 * 60
+HASH_MASK = (1 << 64) - 1
+
+
+def _contains(ids, value):
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def _insert(ids, value):
+    index = bisect_left(ids, value)
+    if index == len(ids) or ids[index] != value:
+        ids.insert(index, value)
+        return True
+    return False
+
+
+def _remove(ids, value):
+    index = bisect_left(ids, value)
+    if index < len(ids) and ids[index] == value:
+        del ids[index]
+        return True
+    return False
+
+
+def _edge_hash(user_id, author_id):
+    # hash кортежа целых не зависит от процесса (PYTHONHASHSEED его не меняет)
+    return hash((user_id, author_id)) & HASH_MASK
+
+
+def fingerprint(edges):
+    """(число подписок, XOR хэшей пар) — для сверки графов без их передачи."""
+    count, checksum = 0, 0
+    for user_id, author_id in edges:
+        count += 1
+        checksum ^= _edge_hash(user_id, author_id)
+    return count, checksum
+
+
+def processes():
+    """Отпечатки графов, опубликованные работающими процессами."""
+    count = cache.get(PROCESSES_KEY, 0)
+    keys = [PROCESS_KEY.format(slot) for slot in range(1, count + 1)]
+    return list(cache.get_many(keys).values())
+
+
+def invalidate():
+    """Поколение без записанной правки: все процессы перечитают граф."""
+    next_version(GENERATION_KEY)
+
+
+class FollowGraph:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._following = {}
+        self._followers = {}
+        self._generation = None
+        self._edges = self._checksum = 0
+        self._slot = self._pid = self._token = None
+
+    def load(self):
+        # поколение — до чтения: правки, попавшие и в выборку, и в журнал,
+        # при догоне применятся повторно, а это ничего не меняет
+        generation = None if connection.in_atomic_block else get_version(GENERATION_KEY)
+        following, followers = {}, {}
+        edges = (
+            Follow.objects.order_by('user_id', 'author_id')
+            .values_list('user_id', 'author_id')
+            .iterator(chunk_size=10000)
+        )
+        count, checksum = 0, 0
+        for user_id, author_id in edges:
+            following.setdefault(user_id, array('q')).append(author_id)
+            followers.setdefault(author_id, []).append(user_id)
+            count += 1
+            checksum ^= _edge_hash(user_id, author_id)
+        followers = {
+            author_id: array('q', sorted(ids)) for author_id, ids in followers.items()
+        }
+        with self._lock:
+            self._following, self._followers = following, followers
+            self._edges, self._checksum = count, checksum
+            # в транзакции могли прочитаться незакоммиченные строки
+            self._generation = generation
+            self._publish()
+
+    def reset(self):
+        with self._lock:
+            self._following, self._followers = {}, {}
+            self._generation = None
+
+    def _fresh(self):
+        generation = get_version(GENERATION_KEY)
+        if generation == self._generation:
+            return
+        with self._lock:
+            # поколение только растёт (потерянное заводится заново из time_ns):
+            # пока ждали блокировку, граф мог догнать другой поток
+            if self._generation is not None and generation <= self._generation:
+                return
+            if self._generation is not None and generation - self._generation <= CATCH_UP_LIMIT:
+                keys = [
+                    CHANGE_KEY.format(number)
+                    for number in range(self._generation + 1, generation + 1)
+                ]
+                changes = cache.get_many(keys)
+                if len(changes) == len(keys):
+                    for key in keys:
+                        self._change(*changes[key])
+                    self._generation = generation
+                    self._publish()
+                    return
+            self.load()
+
+    def _publish(self):
+        if self._generation is None:
+            return
+        key = PROCESS_KEY.format(self._slot)
+        state = cache.get(key) if self._pid == os.getpid() else None
+        # после fork у воркера своя запись, а не запись мастера; после
+        # очистки кэша номер мог достаться другому процессу
+        if self._pid != os.getpid() or state and state['token'] != self._token:
+            cache.add(PROCESSES_KEY, 0, timeout=None)
+            self._slot, self._pid = cache.incr(PROCESSES_KEY), os.getpid()
+            self._token = uuid.uuid4().hex
+            key = PROCESS_KEY.format(self._slot)
+        cache.set(key, {
+            'token': self._token,
+            'process': f'{socket.gethostname()}:{self._pid}',
+            'generation': self._generation,
+            'edges': self._edges,
+            'checksum': self._checksum,
+        }, PROCESS_TIMEOUT)
+
+    def is_following(self, user_id, author_id):
+        if user_id is None:
+            return False
+        self._fresh()
+        return _contains(self._following.get(user_id, ()), author_id)
+
+    def following(self, user_id):
+        self._fresh()
+        return list(self._following.get(user_id, ()))
+
+    def followers(self, author_id):
+        self._fresh()
+        return list(self._followers.get(author_id, ()))
+
+    def _change(self, action, user_id, author_id):
+        if action == 'add':
+            changed = _insert(self._following.setdefault(user_id, array('q')), author_id)
+            _insert(self._followers.setdefault(author_id, array('q')), user_id)
+        else:
+            changed = _remove(self._following.get(user_id, array('q')), author_id)
+            _remove(self._followers.get(author_id, array('q')), user_id)
+        if changed:
+            self._edges += 1 if action == 'add' else -1
+            self._checksum ^= _edge_hash(user_id, author_id)
+
+    def _apply(self, action, user_id, author_id):
+        # incr атомарен; правка ложится в журнал под своим поколением, и
+        # остальные процессы применят её при следующем обращении
+        generation = next_version(GENERATION_KEY)
+        cache.set(CHANGE_KEY.format(generation), (action, user_id, author_id), CHANGE_TIMEOUT)
+        with self._lock:
+            if self._generation is not None and generation == self._generation + 1:
+                self._change(action, user_id, author_id)
+                self._generation = generation
+                self._publish()
+
+    def add(self, user_id, author_id):
+        transaction.on_commit(lambda: self._apply('add', user_id, author_id))
+
+    def remove(self, user_id, author_id):
+        transaction.on_commit(lambda: self._apply('remove', user_id, author_id))
+
+    def check(self):
+        """Сверка с базой: (нет в графе, лишние в графе) — множества пар."""
+        self._fresh()
+        with self._lock:
+            in_graph = {
+                (user_id, author_id)
+                for user_id, ids in self._following.items()
+                for author_id in ids
+            }
+        in_db = set(Follow.objects.values_list('user_id', 'author_id'))
+        return in_db - in_graph, in_graph - in_db
+
+
+graph = FollowGraph()
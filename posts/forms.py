@@ -1,4 +1,7 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from .images import process
 from .models import Post, Comments, Follow
 from django.forms import ModelForm
 
@@ -8,6 +11,26 @@ class CreatePost(ModelForm):
         model = Post
         fields = ['text', 'group', 'image']
 
+    def full_clean(self):
+        # свои проверки и перекодирование — до того, как ImageField
+        # откроет оригинал через PIL; уже сохранённый файл не трогаем
+        self.image_error = None
+        name = self.add_prefix('image')
+        image = self.files.get(name) if self.is_bound else None
+        if isinstance(image, UploadedFile):
+            try:
+                processed = process(image)
+            except ValidationError as error:
+                processed, self.image_error = None, error
+            self.files = self.files.copy()
+            self.files[name] = processed
+        super().full_clean()
+
+    def clean_image(self):
+        if self.image_error is not None:
+            raise self.image_error
+        return self.cleaned_data.get('image')
+
 
 class CreateComment(ModelForm):
     text = forms.CharField(widget=forms.Textarea)
@@ -0,0 +1,159 @@
+"""Обработка картинки поста при загрузке.
+
+Проверки идут от дешёвых к дорогим. Размер файла ограничивается ещё при
+приёме (UploadLimitHandler первым в FILE_UPLOAD_HANDLERS): лишние байты
+не буферизуются ни в памяти, ни во временном файле. Затем размеры в
+пикселях из заголовка (до декодирования и до проверки Django — так
+отсекаются «декомпрессионные бомбы»). JPEG декодируется сразу в уменьшенном
+масштабе через draft(), остальные форматы ограничены лимитом пикселей.
+Затем картинка поворачивается по EXIF, уменьшается до IMAGE_MAX_SIDE и
+перекодируется в IMAGE_FORMAT без метаданных. Сэкономленные байты
+пишутся в лог и копятся в счётчиках (команда image_upload_stats).
+"""
+import io
+import logging
+import os
+import warnings
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageCms, ImageOps
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = 'image_upload_stats:{}'
+STATS = ('images', 'bytes_in', 'bytes_out')
+# форматы, многокадровые файлы которых — анимация
+ANIMATED_FORMATS = ('GIF', 'WEBP', 'PNG')
+
+
+def _count(field, value):
+    # счётчики общие для всех воркеров: image_upload_stats видит их сумму
+    stats_cache = caches[settings.STATS_CACHE]
+    key = STATS_KEY.format(field)
+    stats_cache.add(key, 0, timeout=None)
+    try:
+        stats_cache.incr(key, value)
+    except ValueError:
+        pass
+
+
+def stats():
+    stats_cache = caches[settings.STATS_CACHE]
+    result = {field: stats_cache.get(STATS_KEY.format(field), 0) for field in STATS}
+    result['saved'] = result['bytes_in'] - result['bytes_out']
+    return result
+
+
+class TooLargeUpload(UploadedFile):
+    """Файл, приём которого оборван на IMAGE_UPLOAD_MAX_BYTES; без содержимого."""
+
+    def __init__(self, name, content_type, size):
+        super().__init__(io.BytesIO(), name, content_type, size)
+
+
+class UploadLimitHandler(FileUploadHandler):
+    """Перестаёт передавать файл дальше, как только он превысил лимит.
+
+    Остаток потока дочитывается (за ним могут идти другие поля формы), но
+    следующие обработчики его не получают, а в request.FILES вместо
+    файла попадает TooLargeUpload.
+    """
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_BYTES:
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if file_size > settings.IMAGE_UPLOAD_MAX_BYTES:
+            return TooLargeUpload(self.file_name, self.content_type, file_size)
+        return None
+
+
+def _too_large():
+    return ValidationError(
+        'Файл больше %(limit)s',
+        params={'limit': filesizeformat(settings.IMAGE_UPLOAD_MAX_BYTES)},
+    )
+
+
+def _open(upload):
+    if upload.size > settings.IMAGE_UPLOAD_MAX_BYTES:
+        raise _too_large()
+    upload.seek(0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', Image.DecompressionBombWarning)
+        try:
+            # читает только заголовок
+            image = Image.open(upload)
+        except (OSError, Image.DecompressionBombError, Image.DecompressionBombWarning):
+            raise ValidationError('Картинка повреждена или слишком большая')
+    width, height = image.size
+    if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise ValidationError('Картинка слишком большая: %(width)d×%(height)d',
+                              params={'width': width, 'height': height})
+    return image
+
+
+def _convert(image, mode):
+    """(картинка в mode, ICC-профиль для неё).
+
+    Профиль описывает цветовое пространство источника (например CMYK) и
+    к данным в другом режиме не подходит: цвета пересчитываются по нему
+    в sRGB, а если это не удалось — профиль просто отбрасывается.
+    """
+    profile = image.info.get('icc_profile')
+    if image.mode == mode:
+        return image, profile
+    if profile:
+        try:
+            converted = ImageCms.profileToProfile(
+                image, ImageCms.ImageCmsProfile(io.BytesIO(profile)),
+                ImageCms.createProfile('sRGB'), outputMode=mode,
+            )
+            return converted, None
+        except ImageCms.PyCMSError:
+            pass
+    return image.convert(mode), None
+
+
+def process(upload):
+    """Проверенная и перекодированная картинка для ImageField."""
+    if isinstance(upload, TooLargeUpload):
+        raise _too_large()
+    image = _open(upload)
+    if getattr(image, 'is_animated', False) and image.format in ANIMATED_FORMATS:
+        # анимацию не перекодируем, только проверили размеры
+        upload.seek(0)
+        return upload
+    # остальные многокадровые (MPO с камер — JPEG с превью или стереопарой)
+    # сводятся к первому кадру: уменьшаются и теряют EXIF как обычный JPEG
+    side = settings.IMAGE_MAX_SIDE
+    # JPEG: декодер сразу уменьшает в 2/4/8 раз, полный кадр в память не попадает
+    image.draft('RGB', (side, side))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((side, side), Image.LANCZOS, reducing_gap=3.0)
+    transparent = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+    image, profile = _convert(image, 'RGBA' if transparent else 'RGB')
+
+    output = io.BytesIO()
+    # exif не передаём — метаданные (геопозиция, модель камеры) отбрасываются
+    image.save(
+        output, settings.IMAGE_FORMAT, quality=settings.IMAGE_QUALITY,
+        icc_profile=profile,
+    )
+    name = '{}.{}'.format(
+        os.path.splitext(os.path.basename(upload.name))[0],
+        settings.IMAGE_FORMAT.lower(),
+    )
+    _count('images', 1)
+    _count('bytes_in', upload.size)
+    _count('bytes_out', output.tell())
+    logger.info('Картинка %s: %d → %d байт', upload.name, upload.size, output.tell())
+    return ContentFile(output.getvalue(), name=name)
@@ -0,0 +1,102 @@
+"""Хранилище метаданных sorl.thumbnail: LRU процесса перед кэшем и БД.
+
+Стандартный cached_db KVStore ходит в кэш (а при промахе — в БД) на
+каждое превью. Здесь перед ним стоит LRU в памяти процесса, а get_many
+разрешает превью целой страницы ленты за одно обращение к кэшу и не
+больше одного запроса к БД. Записи LRU живут THUMBNAIL_KVSTORE_LRU_TIMEOUT
+секунд: так до других процессов доходят удаления и новые превью.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBKVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+_MISSING = object()
+
+
+class KVStore(CachedDBKVStore):
+    def __init__(self):
+        super().__init__()
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lru_get(self, key):
+        with self._lock:
+            item = self._lru.get(key)
+            if item is None:
+                return _MISSING
+            value, expires = item
+            if expires < time.monotonic():
+                del self._lru[key]
+                return _MISSING
+            self._lru.move_to_end(key)
+            return value
+
+    def _lru_set(self, key, value):
+        expires = time.monotonic() + settings.THUMBNAIL_KVSTORE_LRU_TIMEOUT
+        with self._lock:
+            self._lru[key] = (value, expires)
+            self._lru.move_to_end(key)
+            while len(self._lru) > settings.THUMBNAIL_KVSTORE_LRU_SIZE:
+                self._lru.popitem(last=False)
+
+    def _lru_delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._lru.pop(key, None)
+
+    def _get_raw(self, key):
+        value = self._lru_get(key)
+        if value is _MISSING:
+            # промах тоже запоминаем: превью ещё нет — не спрашиваем снова
+            value = super()._get_raw(key)
+            self._lru_set(key, value)
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self._lru_set(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        self._lru_delete(*keys)
+
+    def clear(self, delete_thumbnails=False):
+        super().clear(delete_thumbnails)
+        with self._lock:
+            self._lru.clear()
+
+    def get_many(self, image_files):
+        """{key: ImageFile или None} для пачки файлов."""
+        keys = {add_prefix(image_file.key): image_file.key for image_file in image_files}
+        found = {}
+        for raw_key in keys:
+            value = self._lru_get(raw_key)
+            if value is not _MISSING:
+                found[raw_key] = value
+        missing = [raw_key for raw_key in keys if raw_key not in found]
+        if missing:
+            cached = self.cache.get_many(missing)
+            rest = [raw_key for raw_key in missing if raw_key not in cached]
+            if rest:
+                rows = dict(
+                    KVStoreModel.objects.filter(key__in=rest).values_list('key', 'value')
+                )
+                loaded = {raw_key: rows.get(raw_key, EMPTY_VALUE) for raw_key in rest}
+                self.cache.set_many(loaded, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+                cached.update(loaded)
+            for raw_key, value in cached.items():
+                value = None if value is EMPTY_VALUE else value
+                self._lru_set(raw_key, value)
+                found[raw_key] = value
+        return {
+            key: deserialize_image_file(found[raw_key]) if found[raw_key] else None
+            for raw_key, key in keys.items()
+        }
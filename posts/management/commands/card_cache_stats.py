@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import cards
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэша карточек постов'
+
+    def handle(self, *args, **options):
+        stats = cards.stats()
+        self.stdout.write(
+            f"Попаданий: {stats['hits']}, промахов: {stats['misses']}, "
+            f"доля попаданий: {stats['hit_ratio']:.1%}"
+        )
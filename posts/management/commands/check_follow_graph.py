@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import follow_graph
+from posts.caching import get_version
+from posts.models import Follow
+
+
+class Command(BaseCommand):
+    help = 'Сверяет графы подписок работающих процессов с таблицей Follow'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repair', action='store_true',
+            help='при расхождении заставить все процессы перечитать граф'
+        )
+
+    def handle(self, *args, **options):
+        generation = get_version(follow_graph.GENERATION_KEY)
+        edges, checksum = follow_graph.fingerprint(
+            Follow.objects.values_list('user_id', 'author_id').iterator(chunk_size=10000)
+        )
+        if get_version(follow_graph.GENERATION_KEY) != generation:
+            raise CommandError('Подписки менялись во время сверки, повторите')
+        states = follow_graph.processes()
+        if not states:
+            self.stdout.write('Нет процессов с загруженным графом')
+            return
+        behind = [state for state in states if state['generation'] != generation]
+        diverged = [
+            state for state in states
+            if state['generation'] == generation
+            and (state['edges'], state['checksum']) != (edges, checksum)
+        ]
+        self.stdout.write(
+            f'Процессов: {len(states)}, отстают (догонят при следующем '
+            f'обращении): {len(behind)}, расходятся с базой: {len(diverged)}'
+        )
+        for state in diverged:
+            self.stdout.write(
+                f"  {state['process']}: подписок {state['edges']}, в базе {edges}"
+            )
+        if not diverged:
+            self.stdout.write('Графы подписок совпадают с базой')
+            return
+        if not options['repair']:
+            raise CommandError('Граф подписок расходится с базой')
+        follow_graph.invalidate()
+        self.stdout.write('Процессы перечитают граф при следующем обращении')
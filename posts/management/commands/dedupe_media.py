@@ -0,0 +1,82 @@
+import os
+import shutil
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from posts import caching, cards, media
+from posts.models import MediaBlob, Post
+from posts.storage import content_hash, hashed_name, media_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Переименовывает картинки постов по хэшу содержимого, удаляет '
+        'дубликаты и переносит на новые имена счётчики ссылок'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='только показать, что будет сделано')
+
+    def handle(self, *args, **options):
+        storage = media_storage()
+        upload_to = Post._meta.get_field('image').upload_to
+        images = Post.objects.exclude(image='').exclude(image__isnull=True)
+        names = images.order_by().values_list('image', flat=True).distinct()
+        renamed = duplicates = missing = freed = 0
+        for name in list(names):
+            if not storage.exists(name):
+                missing += 1
+                continue
+            with storage.open(name) as content:
+                target = hashed_name(
+                    os.path.join(upload_to, os.path.basename(name)), content_hash(content)
+                )
+            if target == name:
+                continue
+            duplicate = storage.exists(target)
+            if duplicate:
+                duplicates += 1
+                freed += storage.size(name)
+            else:
+                renamed += 1
+            if options['dry_run']:
+                continue
+            if not duplicate:
+                self.link(storage.path(name), storage.path(target))
+            # посты и счётчики ссылок меняются вместе: прерванный запуск
+            # оставляет файл либо целиком старым, либо целиком новым
+            with transaction.atomic():
+                moved = images.filter(image=name).update(image=target)
+                blob, _ = MediaBlob.objects.get_or_create(name=target)
+                MediaBlob.objects.filter(pk=blob.pk).update(
+                    refcount=F('refcount') + moved
+                )
+                MediaBlob.objects.filter(name=name).delete()
+                # старый файл, его превью и ключи sorl — только после коммита
+                transaction.on_commit(partial(media.delete_file, name))
+            self.invalidate(images.filter(image=target))
+
+        self.stdout.write(
+            f'Переименовано: {renamed}, дубликатов удалено: {duplicates} '
+            f'({freed} байт), нет на диске: {missing}'
+        )
+
+    def link(self, source, target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            # жёсткая ссылка: без копирования, а старое имя живо до update
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+    def invalidate(self, posts):
+        rows = list(posts.values_list('pk', 'group_id', 'author_id'))
+        for pk, _, _ in rows:
+            cards.bump(pk)
+        caching.invalidate_feeds(
+            {group_id for _, group_id, _ in rows}, {author_id for _, _, author_id in rows}
+        )
@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def _generate(post_id):
+    try:
+        thumbnails.generate(post_id)
+        return None
+    except Exception as error:
+        return post_id, error
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Генерирует превью картинок для уже существующих постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        post_ids = (
+            Post.objects.exclude(image='').exclude(image__isnull=True)
+            .values_list('pk', flat=True)
+        )
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for result in executor.map(_generate, post_ids.iterator()):
+                done += 1
+                if result is not None:
+                    failed += 1
+                    self.stderr.write(f'Пост {result[0]}: {result[1]}')
+                if done % 100 == 0:
+                    self.stdout.write(f'Обработано: {done}')
+        self.stdout.write(f'Готово: {done}, с ошибками: {failed}')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts import images
+
+
+class Command(BaseCommand):
+    help = 'Показывает, сколько места сэкономила обработка загруженных картинок'
+
+    def handle(self, *args, **options):
+        stats = images.stats()
+        ratio = stats['saved'] / stats['bytes_in'] if stats['bytes_in'] else 0.0
+        self.stdout.write(
+            f"Картинок: {stats['images']}, загружено: {stats['bytes_in']} байт, "
+            f"сохранено: {stats['bytes_out']} байт, экономия: {ratio:.1%}"
+        )
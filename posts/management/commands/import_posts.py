@@ -0,0 +1,231 @@
+import csv
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from groups.models import Group
+from posts import caching, cards, counters, media, search
+from posts.models import Comments, ImportedPost, ImportJob, Post, User
+
+
+def read_ndjson(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        yield {key: value if value != '' else None for key, value in row.items()}
+
+
+def restore_dates(objects, field_name, dates):
+    # bulk_create проставляет auto_now_add сам; исходные даты пишем
+    # следом одним executemany по pk, в той же транзакции
+    if not objects:
+        return
+    model = type(objects[0])
+    field = model._meta.get_field(field_name)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {model._meta.db_table} SET {field.column} = %s WHERE id = %s',
+            [
+                (connection.ops.adapt_datetimefield_value(date), obj.pk)
+                for obj, date in zip(objects, dates)
+            ],
+        )
+    for obj, date in zip(objects, dates):
+        setattr(obj, field_name, date)
+
+
+def parse_date(value):
+    date = parse_datetime(value) if value else None
+    if date is None:
+        return timezone.now()
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+class Command(BaseCommand):
+    help = 'Массовый импорт групп, постов и комментариев из NDJSON или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--author', help='автор для записей без поля author')
+        parser.add_argument(
+            '--checkpoint',
+            help='имя задания: прогресс хранится в базе вместе с пачками, '
+                 'повторный запуск с тем же именем продолжит с места сбоя',
+        )
+
+    def handle(self, *args, **options):
+        self.default_author = options['author']
+        self.job = None
+        self.users, self.groups = {}, {}
+        # исходный id поста -> pk в базе, для комментариев
+        self.post_ids = {}
+        self.stats = dict.fromkeys(('posts', 'comments', 'groups', 'skipped'), 0)
+        self.touched_groups, self.touched_authors = set(), set()
+        done = self.load_checkpoint(options['checkpoint'])
+        reader = read_csv if options['format'] == 'csv' else read_ndjson
+        batch_size = options['batch_size']
+        started = time.monotonic()
+        total = done
+        try:
+            stream = open(options['path'], encoding='utf-8', newline='')
+        except OSError as error:
+            raise CommandError(error)
+        with stream:
+            batch = []
+            for number, record in enumerate(reader(stream)):
+                if number < done:
+                    continue
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    total += self.flush(batch, total)
+                    batch = []
+                    self.progress(total, done, started)
+            if batch:
+                total += self.flush(batch, total)
+        # счётчики — один раз в конце, а не по всей истории авторов на
+        # каждой пачке; при продолжении — и авторы прошлых запусков
+        authors = set(self.touched_authors)
+        if self.job is not None:
+            authors.update(
+                Post.objects.filter(pk__in=self.job.posts.values('post_id'))
+                .order_by().values_list('author_id', flat=True).distinct()
+            )
+        counters.recount(authors)
+        caching.invalidate_feeds(self.touched_groups, self.touched_authors)
+        self.progress(total, done, started)
+        self.stdout.write(
+            'Готово: групп {groups}, постов {posts}, комментариев {comments}, '
+            'пропущено {skipped}'.format(**self.stats)
+        )
+
+    def progress(self, total, done, started):
+        elapsed = time.monotonic() - started
+        rate = (total - done) / elapsed if elapsed else 0
+        self.stdout.write(f'Записей: {total} ({rate:.0f}/с)')
+
+    def load_checkpoint(self, name):
+        if not name:
+            return 0
+        self.job, _ = ImportJob.objects.get_or_create(name=name)
+        if self.job.done:
+            self.stdout.write(f'Продолжение с записи {self.job.done}')
+        return self.job.done
+
+    def resolve(self, records):
+        usernames = {
+            r.get('author') or self.default_author for r in records
+        } - set(self.users) - {None}
+        if usernames:
+            found = User.objects.in_bulk(usernames, field_name='username')
+            self.users.update({name: user.pk for name, user in found.items()})
+        slugs = {r['group'] for r in records if r.get('group')} - set(self.groups)
+        if slugs:
+            found = Group.objects.filter(slug__in=slugs).values_list('slug', 'pk')
+            self.groups.update(found)
+        # посты из прошлых запусков — из базы, только нужные пачке
+        sources = {
+            str(r['post']) for r in records
+            if r.get('type') == 'comment' and r.get('post') is not None
+        } - set(self.post_ids)
+        if sources and self.job is not None:
+            self.post_ids.update(
+                self.job.posts.filter(source__in=sources).values_list('source', 'post_id')
+            )
+
+    def author_id(self, record):
+        return self.users.get(record.get('author') or self.default_author)
+
+    def flush(self, batch, done):
+        groups = [r for r in batch if r.get('type') == 'group']
+        posts = [r for r in batch if r.get('type') == 'post']
+        comments = [r for r in batch if r.get('type') == 'comment']
+        self.stats['skipped'] += len(batch) - len(groups) - len(posts) - len(comments)
+        with transaction.atomic():
+            if groups:
+                self.create_groups(groups)
+            self.resolve(posts + comments)
+            self.create_posts(posts)
+            commented = self.create_comments(comments)
+            if self.job is not None:
+                self.job.done = done + len(batch)
+                self.job.save(update_fields=['done', 'updated'])
+        self.touched_authors |= {self.author_id(r) for r in posts} - {None}
+        for post_id in commented:
+            cards.bump(post_id)
+        return len(batch)
+
+    def create_groups(self, records):
+        groups = [
+            Group(slug=slug, title=r.get('title') or slug,
+                  description=r.get('description') or '')
+            for r in records for slug in [r.get('slug') or r.get('group')] if slug
+        ]
+        # с ignore_conflicts bulk_create возвращает все переданные объекты,
+        # вставленные считаем по базе до и после
+        existing = Group.objects.filter(slug__in={group.slug for group in groups})
+        before = existing.count()
+        Group.objects.bulk_create(groups, ignore_conflicts=True)
+        self.stats['groups'] += existing.count() - before
+
+    def create_posts(self, records):
+        objects, sources, dates = [], [], []
+        for record in records:
+            author_id = self.author_id(record)
+            if author_id is None:
+                self.stats['skipped'] += 1
+                continue
+            group_id = self.groups.get(record.get('group'))
+            if group_id:
+                self.touched_groups.add(group_id)
+            objects.append(Post(
+                text=record.get('text') or '', author_id=author_id,
+                group_id=group_id, image=record.get('image') or '',
+            ))
+            sources.append(record.get('id'))
+            dates.append(parse_date(record.get('date')))
+        objects = Post.objects.bulk_create(objects)
+        restore_dates(objects, 'pub_date', dates)
+        search.index_posts((post.pk, post.text) for post in objects)
+        for post in objects:
+            if post.image:
+                media.acquire(post.image.name)
+        new_ids = {
+            str(source): post.pk
+            for source, post in zip(sources, objects) if source is not None
+        }
+        self.post_ids.update(new_ids)
+        if self.job is not None:
+            ImportedPost.objects.bulk_create(
+                ImportedPost(job=self.job, source=source, post_id=post_id)
+                for source, post_id in new_ids.items()
+            )
+        self.stats['posts'] += len(objects)
+
+    def create_comments(self, records):
+        objects, dates = [], []
+        for record in records:
+            author_id = self.author_id(record)
+            post_id = self.post_ids.get(str(record.get('post')))
+            if author_id is None or post_id is None:
+                self.stats['skipped'] += 1
+                continue
+            objects.append(Comments(
+                post_id=post_id, author_id=author_id, text=record.get('text') or '',
+            ))
+            dates.append(parse_date(record.get('date')))
+        objects = Comments.objects.bulk_create(objects)
+        restore_dates(objects, 'created', dates)
+        self.stats['comments'] += len(objects)
+        return {comment.post_id for comment in objects}
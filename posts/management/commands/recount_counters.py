@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов и подписок, исправляя расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+        checked = repaired = 0
+        batch = []
+        for user_id in user_ids.iterator(chunk_size=batch_size):
+            batch.append(user_id)
+            if len(batch) >= batch_size:
+                repaired += counters.recount(batch)
+                checked += len(batch)
+                batch = []
+        if batch:
+            repaired += counters.recount(batch)
+            checked += len(batch)
+        self.stdout.write(f'Проверено: {checked}, исправлено: {repaired}')
@@ -0,0 +1,45 @@
+"""Счётчики ссылок постов на файлы картинок (см. posts.storage).
+
+acquire и release вызываются сигналами Post. Файл с нулём ссылок и его
+превью удаляются после коммита, когда откатить удаление поста уже нельзя.
+"""
+import logging
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models import F
+from sorl import thumbnail
+from sorl.thumbnail.images import ImageFile
+
+from .models import MediaBlob
+from .storage import media_storage
+
+logger = logging.getLogger(__name__)
+
+
+def acquire(name):
+    blob, created = MediaBlob.objects.get_or_create(name=name, defaults={'refcount': 1})
+    if not created:
+        MediaBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1)
+
+
+def release(name):
+    MediaBlob.objects.filter(name=name, refcount__gt=0).update(
+        refcount=F('refcount') - 1
+    )
+    deleted, _ = MediaBlob.objects.filter(name=name, refcount=0).delete()
+    if deleted:
+        transaction.on_commit(lambda: delete_file(name))
+
+
+def delete_file(name):
+    storage = media_storage()
+    if MediaBlob.objects.filter(name=name).exists():
+        # пока ждали коммита, файл загрузили снова
+        return
+    try:
+        # исходник, его превью и ключи sorl
+        thumbnail.delete(ImageFile(name, storage))
+    except (OSError, SuspiciousFileOperation):
+        # файла уже нет или путь вне MEDIA_ROOT — удалять нечего
+        logger.warning('Не удалось удалить %s', name, exc_info=True)
@@ -0,0 +1,104 @@
+"""Учёт SQL-запросов, времени БД и кэша на каждый запрос.
+
+QueryMetricsMiddleware считает запросы ко всем базам, время в БД,
+попадания в кэш (их отмечают posts.cards и posts.caching через
+record_cache) и общее время. Итог уходит в лог, а заголовок
+Server-Timing получают только при DEBUG и сотрудники (is_staff): число
+запросов и время БД посторонним не показываем. Если view превысила свой
+бюджет из QUERY_BUDGETS, это предупреждение или, при QUERY_BUDGET_RAISE
+(включён под тестами), исключение — так N+1 ловится в тестах.
+"""
+import contextvars
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper: считаем каждый запрос и его время
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+
+def current_metrics():
+    return _current.get()
+
+
+def record_cache(hit):
+    metrics = _current.get()
+    if metrics is None:
+        return
+    if hit:
+        metrics.cache_hits += 1
+    else:
+        metrics.cache_misses += 1
+
+
+def query_budget(view_name):
+    return settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET_DEFAULT)
+
+
+class QueryMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.url_name if match else None
+        user = getattr(request, 'user', None)
+        if settings.DEBUG or user is not None and user.is_staff:
+            response['Server-Timing'] = (
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries", '
+                f'cache;desc="{metrics.cache_hits} hits, {metrics.cache_misses} misses", '
+                f'total;dur={total * 1000:.1f}'
+            )
+        logger.debug(
+            '%s %s: %d queries, db %.1f ms, cache %d/%d, total %.1f ms',
+            request.method, view_name, metrics.queries, metrics.db_time * 1000,
+            metrics.cache_hits, metrics.cache_misses, total * 1000,
+        )
+
+        budget = query_budget(view_name)
+        if budget is not None and metrics.queries > budget:
+            message = (
+                f'View {view_name} выполнила {metrics.queries} SQL-запросов '
+                f'при бюджете {budget}'
+            )
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
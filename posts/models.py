@@ -1,11 +1,28 @@
 from django.db import models
+from django.db.models import F, Func, OuterRef, Subquery
 from django.contrib.auth import get_user_model
 from groups.models import Group
 
+from .storage import media_storage
+
 
 User = get_user_model()
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        # всё, что нужно карточке post_item.html, одним запросом.
+        # Число комментариев — коррелированным подзапросом, а не JOIN с
+        # GROUP BY: так лента читается по индексу и считает только свою страницу
+        comment_count = Comments.objects.filter(post=OuterRef("pk")).order_by()
+        comment_count = comment_count.annotate(
+            total=Func(F("pk"), function="COUNT")
+        ).values("total")
+        return self.select_related("author", "group").annotate(
+            comment_count=Subquery(comment_count)
+        ).order_by("-pub_date", "-pk")
+
+
 class Post(models.Model):
     text = models.TextField(
         help_text="Текст поста(расскажите что-нибудь интересное)"
@@ -29,12 +46,29 @@ class Post(models.Model):
         )
     image = models.ImageField(
         upload_to='posts/',
+        storage=media_storage,
         blank=True,
         null=True
         )
+    # пост разослан по лентам подписчиков (см. posts.timeline)
+    fanned_out = models.BooleanField(default=False, editable=False)
+
+    objects = PostQuerySet.as_manager()
      
     class Meta:
         ordering = ['-pub_date']
+        # под ленты: главная, группа, профиль; id — второй ключ курсора
+        indexes = [
+            models.Index(fields=["-pub_date", "-id"], name="post_feed_idx"),
+            models.Index(fields=["group", "-pub_date", "-id"], name="post_group_feed_idx"),
+            models.Index(fields=["author", "-pub_date", "-id"], name="post_author_feed_idx"),
+            # неразосланные посты подписок (см. posts.timeline)
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                condition=models.Q(fanned_out=False),
+                name="post_pull_feed_idx",
+            ),
+        ]
         
     def __str__(self):
         return self.text
@@ -48,8 +82,70 @@ class Comments(models.Model):
     
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=["post", "-created"], name="comment_post_idx"),
+        ]
 
 
 class Follow(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="follower")
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="following")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "author"], name="unique_follow"),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Запись в ленте подписок пользователя, заполняется при публикации."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries")
+    # копия Post.pub_date: страница ленты — диапазон по индексу без JOIN
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "post"], name="unique_timeline_entry"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-pub_date", "-post"], name="timeline_feed_idx"),
+        ]
+
+
+class UserCounters(models.Model):
+    """Счётчики профиля, обновляются сигналами (см. posts.counters)."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="counters"
+        )
+    posts = models.PositiveIntegerField(default=0)
+    followers = models.PositiveIntegerField(default=0)
+    following = models.PositiveIntegerField(default=0)
+
+
+class MediaBlob(models.Model):
+    """Файл картинки и число постов, которые на него ссылаются."""
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.PositiveIntegerField(default=0)
+
+
+class ImportJob(models.Model):
+    """Прогресс импорта (import_posts --checkpoint), пишется вместе с пачкой."""
+    name = models.CharField(max_length=255, unique=True)
+    done = models.PositiveBigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+
+class ImportedPost(models.Model):
+    """Исходный id поста из файла импорта — для его комментариев."""
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name="posts")
+    source = models.CharField(max_length=255)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["job", "source"], name="unique_imported_post"),
+        ]
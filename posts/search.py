@@ -0,0 +1,75 @@
+"""Полнотекстовый поиск по тексту постов.
+
+На SQLite используется виртуальная таблица FTS5 (создаётся миграцией
+0012_post_search), которая обновляется сигналами при сохранении и
+удалении поста. На других базах поиск деградирует до icontains.
+"""
+import re
+
+from django.db import connection
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def terms(query):
+    return re.findall(r'\w+', query or '')
+
+
+def match_expression(query):
+    # каждое слово в кавычках (без синтаксиса FTS5 от пользователя) и по префиксу
+    return ' '.join('"{}"*'.format(term) for term in terms(query))
+
+
+def index_post(post):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+            [post.pk, post.text],
+        )
+
+
+def index_posts(rows):
+    """Индексирует пачку (pk, text) одним executemany — для массового импорта."""
+    if not available():
+        return
+    rows = list(rows)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)', rows
+        )
+
+
+def remove_post(post_id):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def search(queryset, query):
+    """Посты из queryset по запросу, самые релевантные первыми."""
+    if not terms(query):
+        return queryset.none()
+    if not available():
+        for term in terms(query):
+            queryset = queryset.filter(text__icontains=term)
+        return queryset
+    expression = match_expression(query)
+    table = Post._meta.db_table
+    # FTS-таблица присоединяется один раз: MATCH выполняется единожды,
+    # а rank берётся из той же строки совпадения
+    return queryset.extra(
+        select={'rank': f'{FTS_TABLE}.rank'},
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[expression],
+    ).order_by('rank', '-pub_date', '-pk')
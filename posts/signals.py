@@ -0,0 +1,134 @@
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from groups.models import Group
+
+from . import caching, cards, counters, media, search, thumbnails, timeline
+from .follow_graph import graph
+from .models import Comments, Follow, Post, User, UserCounters
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    # прежние группа (её ленту тоже сбрасываем) и картинка (этот пост
+    # на неё больше не ссылается)
+    instance._previous_group_id = instance._previous_image = None
+    if instance.pk and not raw:
+        instance._previous_group_id, instance._previous_image = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', 'image').first()
+        ) or (None, None)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    cards.bump(instance.pk)
+    search.index_post(instance)
+    if instance.image and not raw:
+        thumbnails.schedule(instance.pk)
+    caching.invalidate_feeds(
+        (instance.group_id, getattr(instance, '_previous_group_id', None)),
+        (instance.author_id,),
+    )
+    if created and not raw:
+        timeline.fan_out(instance)
+        counters.bump(instance.author_id, 'posts', 1)
+    if not raw:
+        previous = getattr(instance, '_previous_image', None) or None
+        current = instance.image.name or None
+        if current != previous:
+            if current:
+                media.acquire(current)
+            if previous:
+                media.release(previous)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+    caching.invalidate_feeds((instance.group_id,), (instance.author_id,))
+    counters.bump(instance.author_id, 'posts', -1)
+    if instance.image:
+        media.release(instance.image.name)
+
+
+@receiver(post_save, sender=Comments)
+@receiver(post_delete, sender=Comments)
+def comment_changed(sender, instance, **kwargs):
+    # в карточке выводится число комментариев
+    cards.bump(instance.post_id)
+    group_id, author_id = Post.objects.filter(pk=instance.post_id).values_list(
+        'group_id', 'author_id'
+    ).first() or (None, None)
+    caching.invalidate_feeds((group_id,), (author_id,))
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, raw=False, **kwargs):
+    # название и описание группы — в шапке её ленты, название и slug —
+    # в карточках её постов, а они есть и в профилях авторов
+    caching.invalidate_feeds((instance.pk,))
+    if raw:
+        return
+    cards.bump_group(instance.pk)
+    authors = User.objects.filter(posts__group=instance).order_by().distinct()
+    caching.invalidate_scopes(
+        f'author:{username}' for username in authors.values_list('username', flat=True)
+    )
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # вход пишет только last_login, имя тогда не проверяем
+    instance._previous_username = None
+    if instance.pk and not raw and (update_fields is None or 'username' in update_fields):
+        instance._previous_username = (
+            User.objects.filter(pk=instance.pk).values_list('username', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        # у нового пользователя все счётчики нулевые: строка сразу, без
+        # пересчёта по таблицам при первом показе профиля
+        UserCounters.objects.create(user=instance)
+        return
+    previous = getattr(instance, '_previous_username', None)
+    if previous is None or previous == instance.username:
+        return
+    # имя автора — в карточках всех его постов, а ленты и ETag
+    # профиля привязаны к имени
+    cards.bump_author(instance.pk)
+    groups = Group.objects.filter(posts__author=instance).order_by().distinct()
+    caching.invalidate_scopes(
+        ['index']
+        + [f'group:{slug}' for slug in groups.values_list('slug', flat=True)]
+        + [f'{scope}:{username}' for scope in ('author', 'follow')
+           for username in (previous, instance.username)]
+    )
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        graph.add(instance.user_id, instance.author_id)
+        caching.invalidate_follows(instance.user_id, instance.author_id)
+        timeline.schedule_backfill(instance.user_id, instance.author_id)
+        counters.bump(instance.user_id, 'following', 1)
+        counters.bump(instance.author_id, 'followers', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    graph.remove(instance.user_id, instance.author_id)
+    caching.invalidate_follows(instance.user_id, instance.author_id)
+    timeline.trim(instance.user_id, instance.author_id)
+    counters.bump(instance.user_id, 'following', -1)
+    counters.bump(instance.author_id, 'followers', -1)
+
+
+@receiver(post_migrate)
+def database_reset(sender, **kwargs):
+    # migrate и flush (в том числе между тестами) меняют базу целиком
+    graph.reset()
@@ -0,0 +1,42 @@
+"""Хранилище картинок постов с именами по хэшу содержимого.
+
+Файл сохраняется как posts/ab/<sha256>.<ext>: одинаковые загрузки
+получают одно имя и лежат на диске один раз, а превью sorl (их ключ —
+имя исходника) становятся общими для всех копий. Сколько постов
+ссылается на файл, считает MediaBlob (см. posts.media); файл удаляется,
+когда ссылок не остаётся.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks() if hasattr(content, 'chunks') else iter(
+        lambda: content.read(64 * 1024), b''
+    ):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    directory, filename = os.path.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(directory, digest[:2], digest + extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        name = hashed_name(name, content_hash(content))
+        if self.exists(name):
+            # такой файл уже есть — второй раз не пишем
+            return name
+        return super().save(name, content, max_length)
+
+
+def media_storage():
+    return ContentAddressedStorage()
@@ -0,0 +1,56 @@
+from django import template
+
+from posts import cards, thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    # карточка поста из кэша, см. posts.cards; при первой карточке
+    # страницы ленты (page) весь её набор читается из кэша пачкой
+    prefetched = context.render_context.get('post_cards')
+    if prefetched is None:
+        page = context.get('page')
+        prefetched = cards.prefetch(page) if page is not None else {}
+        context.render_context['post_cards'] = prefetched
+    return cards.render(post, context.get('user'), context, prefetched.get(post.pk))
+
+
+@register.simple_tag
+def post_thumbnail(post, size='feed'):
+    # готовое превью или оригинал, пока превью делается в фоне
+    image = getattr(post, 'image', None)
+    if not image:
+        return None
+    thumbnail = thumbnails.lookup(image, size)
+    if thumbnail is None:
+        if thumbnails.source_exists(image):
+            thumbnails.schedule(post.pk)
+        return image
+    return thumbnail
+
+
+@register.simple_tag
+def page_window(page, on_each_side=2, on_ends=1):
+    """Номера страниц около текущей и по краям, None — пропуск («…»).
+
+    Ссылки на все страницы подряд на большой ленте — тысячи элементов
+    и сотни килобайт HTML на каждую страницу.
+    """
+    number, last = page.number, page.paginator.num_pages
+    start = max(1, number - on_each_side)
+    end = min(last, number + on_each_side)
+    pages = []
+    if start > on_ends + 1:
+        pages.extend(range(1, on_ends + 1))
+        pages.append(None)
+    else:
+        start = 1
+    pages.extend(range(start, end + 1))
+    if end < last - on_ends:
+        pages.append(None)
+        pages.extend(range(last - on_ends + 1, last + 1))
+    else:
+        pages.extend(range(end + 1, last + 1))
+    return pages
@@ -1,12 +1,40 @@
 from http import client
+import json
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+from io import BytesIO, StringIO
 from socket import fromfd
 from urllib import response
 
-from django.core.cache import cache
-from django.test import Client
-from django.test import TestCase
-from .models import Post, User, Group
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.paginator import Paginator
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.test.utils import CaptureQueriesContext
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, override_settings
+from django.test import TestCase, TransactionTestCase
+from PIL import Image as PILImage, ImageCms
+from sorl.thumbnail import default as sorl_default
+
+from . import cards, counters, images, thumbnails, timeline
+from .caching import FEED_VERSION_KEY
+from .follow_graph import FollowGraph, graph
+from .middleware import QueryBudgetExceeded
+from .templatetags.post_tags import page_window
+from .models import Post, User, Group, Follow, TimelineEntry, UserCounters, Comments, MediaBlob, ImportJob
 from django.urls import reverse
+from yatube.cache import SharedFileCache
+from yatube.sqlite import retry_on_busy
+from yatube.warmup import warm_templates
+from yatube.db_router import PIN_COOKIE, PrimaryReplicaRouter, ReplicaMiddleware
 
 # проверяют, что срабатывает защита от загрузки файлов не-графических форматов
 
@@ -138,6 +166,17 @@ class ImageTests(TestCase):
             self.assertEqual(response.status_code,200)
             self.assertContains(response, '<img')
 
+    # пока превью нет, в ленте оригинал, после фоновой генерации — превью
+    def test_thumbnail_generated_in_background(self):
+        post = Post.objects.get(text=self.test_text)
+        response = self.auth_client.get(reverse('index'))
+        self.assertContains(response, f'src="{post.image.url}"')
+        thumbnails.generate(post.pk)
+        thumbnail = thumbnails.lookup(post.image)
+        self.assertIsNotNone(thumbnail)
+        response = self.auth_client.get(reverse('index'))
+        self.assertContains(response, f'src="{thumbnail.url}"')
+
     # проверяют, что срабатывает защита от загрузки файлов не-графических форматов
     def test_img_wrong_format(self):
         Post.objects.all().delete()
@@ -173,4 +212,1021 @@ class CashTest(TestCase):
         self.assertNotContains(response, test_text2)
         cache.clear()
         response = self.auth_client.get('/')
-        self.assertContains(response, test_text2)
\ No newline at end of file
+        self.assertContains(response, test_text2)
+
+class CursorPaginatorTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create(username='test_user', email='user@test.com')
+        for i in range(25):
+            Post.objects.create(text=f'post {i}', author=self.user)
+        self.expected = list(Post.objects.order_by('-pub_date', '-pk'))
+
+    # проходим ленту курсором вперёд и назад
+    def test_cursor_walk(self):
+        response = self.client.get(reverse('index'), {'cursor': ''})
+        page = response.context['page']
+        seen = list(page)
+        self.assertFalse(page.has_previous())
+        while page.has_next():
+            response = self.client.get(reverse('index'), {'cursor': page.next_cursor})
+            page = response.context['page']
+            seen += list(page)
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(page), 5)
+
+        response = self.client.get(reverse('index'), {'cursor': page.previous_cursor})
+        page = response.context['page']
+        self.assertEqual(list(page), self.expected[10:20])
+        self.assertTrue(page.has_next())
+        self.assertTrue(page.has_previous())
+
+    # битый курсор отдаёт первую страницу, номера страниц работают как раньше
+    def test_fallbacks(self):
+        response = self.client.get(reverse('index'), {'cursor': 'garbage'})
+        self.assertEqual(list(response.context['page']), self.expected[:10])
+        with self.settings(FEED_PAGINATION='cursor'):
+            response = self.client.get(reverse('index'), {'page': 3})
+            self.assertEqual(list(response.context['page']), self.expected[20:])
+            response = self.client.get(reverse('index'))
+            self.assertContains(response, '?cursor=')
+
+
+class TimelineTest(TestCase):
+    def setUp(self):
+        self.auth_client = Client()
+        self.reader = User.objects.create(username='reader')
+        self.author = User.objects.create(username='author')
+        self.auth_client.force_login(self.reader)
+
+    def follow_page(self):
+        return list(self.auth_client.get(reverse('follow_index')).context['page'])
+
+    # пост раскладывается по лентам подписчиков, отписка чистит ленту
+    def test_fan_out_and_trim(self):
+        old_post = Post.objects.create(text='old', author=self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.auth_client.get(reverse('profile_follow', kwargs={'username': 'author'}))
+        post = Post.objects.create(text='new', author=self.author)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader, post=post).exists())
+        self.assertEqual(self.follow_page(), [post, old_post])
+
+        self.auth_client.get(reverse('profile_unfollow', kwargs={'username': 'author'}))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.follow_page(), [])
+
+    # старые посты попадают в ленту после коммита подписки, пачками;
+    # пачка, записанная после отписки, не остаётся в ленте
+    def test_backfill_after_commit(self):
+        for i in range(3):
+            Post.objects.create(text=f'old {i}', author=self.author)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.auth_client.get(reverse('profile_follow', kwargs={'username': 'author'}))
+        self.assertFalse(TimelineEntry.objects.exists())
+        with self.settings(TIMELINE_BATCH_SIZE=2):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 3)
+        Follow.objects.filter(user=self.reader).delete()
+        timeline.backfill(self.reader.pk, self.author.pk)
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    # посты популярных авторов не рассылаются, а подмешиваются при чтении
+    def test_hybrid_merge(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        with self.settings(TIMELINE_FANOUT_LIMIT=0):
+            post = Post.objects.create(text='big', author=self.author)
+        self.assertFalse(post.fanned_out)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.follow_page(), [post])
+
+    # разосланные и неразосланные посты идут одной лентой по страницам
+    def test_merged_feed_pages(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = []
+        for i in range(5):
+            with self.settings(TIMELINE_FANOUT_LIMIT=i % 2):
+                posts.append(Post.objects.create(text=f'post {i}', author=self.author))
+        posts.reverse()
+        with self.settings(POSTS_PER_PAGE=2):
+            seen, cursor = [], ''
+            while cursor is not None:
+                page = self.auth_client.get(
+                    reverse('follow_index'), {'cursor': cursor}
+                ).context['page']
+                seen += list(page)
+                cursor = page.next_cursor
+            self.assertEqual(seen, posts)
+            previous = self.auth_client.get(
+                reverse('follow_index'), {'cursor': page.previous_cursor}
+            ).context['page']
+            self.assertEqual(list(previous), posts[2:4])
+            response = self.auth_client.get(reverse('follow_index'), {'page': 2})
+            self.assertEqual(list(response.context['page']), posts[2:4])
+            self.assertEqual(response.context['paginator'].count, 5)
+
+    # рассылка не зависит от графа: подписка, которой граф не видел
+    def test_fan_out_reads_follows_from_db(self):
+        graph.load()
+        Follow.objects.bulk_create([Follow(user=self.reader, author=self.author)])
+        post = Post.objects.create(text='new', author=self.author)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader, post=post).exists())
+
+
+class FeedQueriesTest(TestCase):
+    # запросов на страницу ленты не больше бюджета и не зависит от числа постов
+    QUERY_BUDGET = 6
+
+    def setUp(self):
+        self.auth_client = Client()
+        self.user = User.objects.create(username='reader')
+        self.auth_client.force_login(self.user)
+        self.group = Group.objects.create(title='group', slug='group', description='-')
+        # прогреваем кэш пользователя, чтобы сравнивать одинаковые запросы
+        self.auth_client.get(reverse('index'))
+
+    def add_posts(self, count):
+        for i in range(count):
+            author = User.objects.create(username=f'author_{Post.objects.count()}')
+            Follow.objects.create(user=self.user, author=author)
+            post = Post.objects.create(text=f'post {i}', author=author, group=self.group)
+            post.comments.create(author=self.user, text='comment')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.auth_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_feed_query_budget(self):
+        urls = (
+            reverse('index'),
+            reverse('group', kwargs={'slug': 'group'}),
+            reverse('follow_index'),
+        )
+        self.add_posts(1)
+        single = [self.count_queries(url) for url in urls]
+        self.add_posts(9)
+        full = [self.count_queries(url) for url in urls]
+        self.assertEqual(single, full)
+        for count in full:
+            self.assertLessEqual(count, self.QUERY_BUDGET)
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.auth_client = Client()
+        self.user = User.objects.create(username='reader')
+        self.author = User.objects.create(username='author')
+        self.auth_client.force_login(self.user)
+
+    def counters(self, user):
+        return UserCounters.objects.values('posts', 'followers', 'following').get(user=user)
+
+    # счётчики меняются при публикации, удалении и подписке
+    def test_counters_follow_changes(self):
+        self.auth_client.post(reverse('new_post'), data={'text': 'text'})
+        post = Post.objects.create(text='text', author=self.author)
+        self.auth_client.get(reverse('profile_follow', kwargs={'username': 'author'}))
+        self.assertEqual(self.counters(self.user), {'posts': 1, 'followers': 0, 'following': 1})
+        self.assertEqual(self.counters(self.author), {'posts': 1, 'followers': 1, 'following': 0})
+
+        post.delete()
+        self.auth_client.get(reverse('profile_unfollow', kwargs={'username': 'author'}))
+        self.assertEqual(self.counters(self.author), {'posts': 0, 'followers': 0, 'following': 0})
+        response = self.auth_client.get(reverse('profile', kwargs={'username': 'author'}))
+        self.assertContains(response, 'Записей: 0')
+
+    # счётчик, разошедшийся до нуля, не ломает отписку и удаление поста
+    def test_decrement_below_zero(self):
+        post = Post.objects.create(text='text', author=self.author)
+        self.auth_client.get(reverse('profile_follow', kwargs={'username': 'author'}))
+        UserCounters.objects.update(posts=0, followers=0, following=0)
+        self.auth_client.get(reverse('profile_unfollow', kwargs={'username': 'author'}))
+        post.delete()
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(self.counters(self.author), {'posts': 0, 'followers': 0, 'following': 0})
+
+    # пересчёт в GET читает из основной базы, куда и пишет, а не с реплики
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_recount_reads_primary(self):
+        Post.objects.create(text='text', author=self.author)
+        UserCounters.objects.filter(user=self.author).delete()
+
+        def view(request):
+            counters.recount([self.author.pk])
+            return HttpResponse()
+
+        ReplicaMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(self.counters(self.author)['posts'], 1)
+
+    # команда исправляет расхождения со счётом по таблицам
+    def test_recount_command(self):
+        Post.objects.create(text='text', author=self.author)
+        UserCounters.objects.filter(user=self.author).update(posts=42)
+        UserCounters.objects.filter(user=self.user).delete()
+        call_command('recount_counters', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.counters(self.author)['posts'], 1)
+        self.assertEqual(self.counters(self.user)['posts'], 0)
+
+
+class PostCardCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['stats'].clear()
+        self.author_client = Client()
+        self.reader_client = Client()
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        self.author_client.force_login(self.author)
+        self.reader_client.force_login(self.reader)
+        self.post = Post.objects.create(text='first text', author=self.author)
+
+    # второй показ карточки берётся из кэша, кнопка правки — только автору
+    def test_card_cached_per_post_not_per_user(self):
+        response = self.reader_client.get(reverse('index'))
+        self.assertNotContains(response, 'Редактировать')
+        response = self.author_client.get(reverse('index'))
+        self.assertContains(response, 'Редактировать')
+        self.assertEqual(cards.stats()['hits'], 1)
+        self.assertEqual(cards.stats()['misses'], 1)
+
+    # правка поста и новый комментарий меняют версию карточки
+    def test_card_invalidated(self):
+        self.reader_client.get(reverse('index'))
+        self.author_client.post(
+            reverse('post_edit', kwargs={'username': 'author', 'post_id': self.post.pk}),
+            data={'text': 'second text'}
+        )
+        self.assertContains(self.reader_client.get(reverse('index')), 'second text')
+        self.reader_client.post(
+            reverse('add_comment', kwargs={'username': 'author', 'post_id': self.post.pk}),
+            data={'text': 'comment'}
+        )
+        self.assertContains(self.reader_client.get(reverse('index')), '1 комментариев')
+        self.assertEqual(cards.stats()['hits'], 0)
+
+    # команда показывает счётчики всех воркеров, а не своего процесса
+    def test_stats_shared_between_processes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = {'BACKEND': 'yatube.cache.SharedFileCache', 'LOCATION': directory.name}
+        with self.settings(CACHES={**settings.CACHES, 'stats': shared}):
+            self.reader_client.get(reverse('index'))
+            other_process = SharedFileCache(directory.name, {})
+            other_process.incr(cards.STATS_KEY.format('hits'), 3)
+            out = StringIO()
+            call_command('card_cache_stats', stdout=out)
+        self.assertIn('Попаданий: 3, промахов: 1', out.getvalue())
+
+    # название группы и имя автора в карточке не устаревают
+    def test_card_follows_group_and_author(self):
+        group = Group.objects.create(title='old group', slug='group', description='-')
+        self.post.group = group
+        self.post.save()
+        profile = reverse('profile', kwargs={'username': 'author'})
+        etag = self.reader_client.get(profile)['ETag']
+        self.reader_client.get(reverse('index'))
+        group.title = 'new group'
+        group.save()
+        self.assertContains(self.reader_client.get(reverse('index')), 'new group')
+        self.assertNotEqual(self.reader_client.get(profile)['ETag'], etag)
+        self.author.username = 'renamed'
+        self.author.save()
+        self.assertContains(self.reader_client.get(reverse('index')), 'renamed')
+
+
+class AnonymousPageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create(username='author')
+        self.group = Group.objects.create(title='group', slug='group', description='-')
+        Post.objects.create(text='first post', author=self.user, group=self.group)
+
+    # повторный анонимный запрос не ходит в базу
+    def test_page_served_from_cache(self):
+        for url in (reverse('index'), reverse('group', kwargs={'slug': 'group'})):
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertContains(response, 'first post')
+            self.assertIn('public', response['Cache-Control'])
+            self.assertIn('Cookie', response['Vary'])
+
+    # новый пост в ленте сбрасывает её кэш
+    def test_page_invalidated_on_post_save(self):
+        url = reverse('group', kwargs={'slug': 'group'})
+        self.client.get(reverse('index'))
+        self.client.get(url)
+        post = Post.objects.create(text='second post', author=self.user, group=self.group)
+        self.assertContains(self.client.get(reverse('index')), 'second post')
+        self.assertContains(self.client.get(url), 'second post')
+        post.delete()
+        self.assertNotContains(self.client.get(url), 'second post')
+
+
+class SharedCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = SharedFileCache(directory.name, {})
+
+    # incr из нескольких процессов не теряет увеличений
+    def test_incr_is_atomic_between_processes(self):
+        self.cache.add('counter', 0, timeout=None)
+        processes = [
+            multiprocessing.get_context('fork').Process(target=_incr_many, args=(self.cache, 100))
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get('counter'), 400)
+
+    # incr не сбрасывает срок жизни ключа
+    def test_incr_keeps_timeout(self):
+        self.cache.set('version', 1, timeout=None)
+        self.cache.incr('version')
+        with open(self.cache._key_to_file('version'), 'rb') as f:
+            self.assertIsNone(pickle.load(f))
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+
+def _incr_many(shared, times):
+    for _ in range(times):
+        shared.incr('counter')
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.auth_client = Client()
+        self.user = User.objects.create(username='author')
+        self.auth_client.force_login(self.user)
+        self.auth_client.post(reverse('new_post'), data={'text': 'Котики захватили интернет'})
+        self.auth_client.post(reverse('new_post'), data={'text': 'Про собак и котиков, котики котики'})
+        self.auth_client.post(reverse('new_post'), data={'text': 'Погода сегодня'})
+
+    def found(self, query):
+        response = self.client.get(reverse('search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [post.text for post in response.context['page']]
+
+    # ищет по префиксу слова, релевантные выше
+    def test_search_ranked(self):
+        self.assertEqual(self.found('котик'), [
+            'Про собак и котиков, котики котики',
+            'Котики захватили интернет',
+        ])
+        self.assertEqual(self.found(''), [])
+        self.assertEqual(self.found('"AND OR'), [])
+
+    # индекс обновляется при правке и удалении поста
+    def test_index_updates(self):
+        post = Post.objects.get(text='Погода сегодня')
+        self.auth_client.post(
+            reverse('post_edit', kwargs={'username': 'author', 'post_id': post.pk}),
+            data={'text': 'Солнечная погода'}
+        )
+        self.assertEqual(self.found('солнечная'), ['Солнечная погода'])
+        post.delete()
+        self.assertEqual(self.found('погода'), [])
+
+
+class QueryMetricsMiddlewareTest(TestCase):
+    def setUp(self):
+        self.auth_client = Client()
+        self.user = User.objects.create(username='author')
+        self.auth_client.force_login(self.user)
+        for i in range(10):
+            post = Post.objects.create(text=f'post {i}', author=self.user)
+            post.comments.create(author=self.user, text='comment')
+
+    # Server-Timing с числом запросов — только сотрудникам и при DEBUG
+    def test_server_timing_header(self):
+        self.assertNotIn('Server-Timing', self.auth_client.get(reverse('index')))
+        with self.settings(DEBUG=True):
+            self.assertIn('Server-Timing', Client().get(reverse('index')))
+        self.user.is_staff = True
+        self.user.save()
+        response = self.auth_client.get(reverse('index'))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    # все страницы укладываются в бюджеты запросов из настроек
+    def test_views_within_budget(self):
+        urls = (
+            reverse('index'),
+            reverse('profile', kwargs={'username': 'author'}),
+            reverse('post', kwargs={'username': 'author', 'post_id': 1}),
+            reverse('follow_index'),
+            reverse('search') + '?q=post',
+        )
+        with self.settings(QUERY_BUDGET_RAISE=True):
+            for url in urls:
+                self.assertEqual(self.auth_client.get(url).status_code, 200)
+
+    def test_budget_exceeded(self):
+        with self.settings(QUERY_BUDGET_RAISE=True, QUERY_BUDGETS={'index': 1}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.auth_client.get(reverse('index'))
+
+
+class CommentsPaginationTest(TestCase):
+    def setUp(self):
+        self.auth_client = Client()
+        self.user = User.objects.create(username='author')
+        self.auth_client.force_login(self.user)
+        self.post = Post.objects.create(text='text', author=self.user)
+        for i in range(25):
+            Comments.objects.create(post=self.post, author=self.user, text=f'comment {i}')
+        self.kwargs = {'username': 'author', 'post_id': self.post.pk}
+
+    # на странице поста первая порция, остальное — фрагментом по курсору
+    def test_comments_paginated(self):
+        response = self.auth_client.get(reverse('post', kwargs=self.kwargs))
+        page = response.context['comments']
+        self.assertEqual([c.text for c in page], [f'comment {i}' for i in range(24, 4, -1)])
+        self.assertContains(response, 'Показать ещё')
+        response = self.auth_client.get(
+            reverse('post_comments', kwargs=self.kwargs), {'cursor': page.next_cursor}
+        )
+        page = response.context['comments']
+        self.assertEqual([c.text for c in page], [f'comment {i}' for i in range(4, -1, -1)])
+        self.assertNotContains(response, '<html')
+        self.assertNotContains(response, 'Показать ещё')
+
+    # ajax-комментарий возвращает только свой фрагмент
+    def test_ajax_add_comment(self):
+        response = self.auth_client.post(
+            reverse('add_comment', kwargs=self.kwargs), {'text': 'new one'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertContains(response, 'new one', status_code=201)
+        self.assertNotContains(response, 'comment 1', status_code=201)
+
+
+class FollowGraphTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        graph.reset()
+        self.reader = User.objects.create(username='reader')
+        self.author = User.objects.create(username='author')
+        self.other = User.objects.create(username='other')
+        self.auth_client = Client()
+        self.auth_client.force_login(self.reader)
+
+    # подписка учитывает зрителя и обновляет граф без перечитывания
+    def test_follow_updates_graph(self):
+        Follow.objects.create(user=self.other, author=self.author)
+        graph.load()
+        response = self.auth_client.get(reverse('profile', kwargs={'username': 'author'}))
+        self.assertFalse(response.context['following'])
+
+        self.auth_client.get(reverse('profile_follow', kwargs={'username': 'author'}))
+        with self.assertNumQueries(0):
+            self.assertTrue(graph.is_following(self.reader.pk, self.author.pk))
+            self.assertEqual(graph.followers(self.author.pk), [self.reader.pk, self.other.pk])
+            self.assertEqual(graph.following(self.reader.pk), [self.author.pk])
+
+        self.auth_client.get(reverse('profile_unfollow', kwargs={'username': 'author'}))
+        self.assertFalse(graph.is_following(self.reader.pk, self.author.pk))
+        self.assertEqual(graph.check(), (set(), set()))
+
+    # сверка находит изменения в обход сигналов
+    def test_consistency_check(self):
+        graph.load()
+        Follow.objects.bulk_create([Follow(user=self.reader, author=self.other)])
+        self.assertEqual(graph.check(), ({(self.reader.pk, self.other.pk)}, set()))
+        with self.assertRaises(CommandError):
+            call_command('check_follow_graph', stdout=StringIO())
+        call_command('check_follow_graph', repair=True, stdout=StringIO())
+        self.assertTrue(graph.is_following(self.reader.pk, self.other.pk))
+        call_command('check_follow_graph', stdout=StringIO())
+
+    # другой процесс догоняет правку по журналу в кэше, без перечитывания;
+    # сверка и починка касаются графов всех процессов, а не своего
+    def test_other_process(self):
+        other_process = FollowGraph()
+        other_process.load()
+        graph.load()
+        self.auth_client.get(reverse('profile_follow', kwargs={'username': 'author'}))
+        with self.assertNumQueries(0):
+            self.assertTrue(other_process.is_following(self.reader.pk, self.author.pk))
+        Follow.objects.bulk_create([Follow(user=self.reader, author=self.other)])
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('check_follow_graph', stdout=out)
+        self.assertIn('расходятся с базой: 2', out.getvalue())
+        call_command('check_follow_graph', repair=True, stdout=StringIO())
+        self.assertTrue(other_process.is_following(self.reader.pk, self.other.pk))
+        out = StringIO()
+        call_command('check_follow_graph', stdout=out)
+        self.assertIn('отстают (догонят при следующем обращении): 1', out.getvalue())
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.auth_client = Client()
+        self.user = User.objects.create(username='author')
+        self.other = User.objects.create(username='other')
+        self.auth_client.force_login(self.user)
+        self.post = Post.objects.create(text='первый', author=self.user)
+        Post.objects.create(text='чужой', author=self.other)
+        Comments.objects.create(post=self.post, author=self.user, text='коммент')
+
+    # выгрузка отдаётся потоком и содержит только данные пользователя
+    def test_export_ndjson(self):
+        response = self.auth_client.get(reverse('export_user_data', kwargs={'username': 'author'}))
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([(r['type'], r['text']) for r in rows],
+                         [('post', 'первый'), ('comment', 'коммент')])
+        self.assertEqual(rows[1]['post'], self.post.pk)
+
+    def test_export_csv_and_access(self):
+        url = reverse('export_user_data', kwargs={'username': 'author'})
+        response = self.auth_client.get(url, {'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        response = self.auth_client.get(reverse('export_user_data', kwargs={'username': 'other'}))
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_user', 'author', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+class ImportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='author')
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, 'data.ndjson')
+        records = [{'type': 'group', 'slug': 'imported', 'title': 'Импорт'}]
+        for i in range(5):
+            records.append({'type': 'post', 'id': i, 'author': 'author', 'group': 'imported',
+                            'text': f'старый пост {i}', 'date': f'2015-01-0{i + 1}T10:00:00+00:00'})
+        records.append({'type': 'comment', 'id': 1, 'post': 4, 'author': 'author', 'text': 'ок'})
+        records.append({'type': 'post', 'author': 'nobody', 'text': 'без автора'})
+        with open(self.path, 'w', encoding='utf-8') as stream:
+            stream.writelines(json.dumps(r) + '\n' for r in records)
+
+    # даты сохраняются, связи и счётчики восстанавливаются
+    def test_import(self):
+        call_command('import_posts', self.path, batch_size=3, stdout=StringIO())
+        posts = Post.objects.filter(group__slug='imported').order_by('pub_date')
+        self.assertEqual(posts.count(), 5)
+        self.assertEqual(posts[0].pub_date.year, 2015)
+        self.assertEqual(Comments.objects.get().post, posts[4])
+        self.assertEqual(UserCounters.objects.get(user=self.user).posts, 5)
+        response = Client().get(reverse('search'), {'q': 'старый'})
+        self.assertEqual(len(response.context['page']), 5)
+
+    # в итоге считаются только действительно созданные группы
+    def test_groups_counted_once(self):
+        with open(self.path, 'a', encoding='utf-8') as stream:
+            stream.write(json.dumps({'type': 'group', 'slug': 'second'}) + '\n')
+        out = StringIO()
+        call_command('import_posts', self.path, stdout=out)
+        self.assertIn('Готово: групп 2,', out.getvalue())
+        out = StringIO()
+        call_command('import_posts', self.path, stdout=out)
+        self.assertIn('Готово: групп 0,', out.getvalue())
+
+    # повторный запуск с тем же checkpoint ничего не дублирует
+    def test_resume(self):
+        checkpoint = os.path.join(self.dir.name, 'state')
+        call_command('import_posts', self.path, batch_size=3, checkpoint=checkpoint,
+                     stdout=StringIO())
+        call_command('import_posts', self.path, batch_size=3, checkpoint=checkpoint,
+                     stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 5)
+        self.assertEqual(Comments.objects.count(), 1)
+
+    # сбой в пачке откатывает и её, и прогресс; продолжение не дублирует
+    def test_resume_after_failure(self):
+        records = [
+            {'type': 'post', 'id': i, 'author': 'author', 'text': f'пост {i}'}
+            for i in range(6)
+        ]
+        records.append({'type': 'comment', 'post': 1, 'author': 'author', 'text': 'ок'})
+        records.append({'type': 'post', 'author': 'author', 'text': 'битый',
+                        'date': '2015-13-01T10:00:00'})
+
+        def write():
+            with open(self.path, 'w', encoding='utf-8') as stream:
+                stream.writelines(json.dumps(r) + '\n' for r in records)
+
+        write()
+        with self.assertRaises(ValueError):
+            call_command('import_posts', self.path, batch_size=3, checkpoint='job',
+                         stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 6)
+        self.assertEqual(ImportJob.objects.get(name='job').done, 6)
+        records[-1]['date'] = '2015-12-01T10:00:00'
+        write()
+        call_command('import_posts', self.path, batch_size=3, checkpoint='job',
+                     stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 7)
+        self.assertEqual(Comments.objects.get().post.text, 'пост 1')
+        self.assertEqual(UserCounters.objects.get(user=self.user).posts, 7)
+        self.assertTrue(Post._meta.get_field('pub_date').auto_now_add)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = PrimaryReplicaRouter()
+
+    def run_view(self, request, write=False):
+        routes = []
+
+        def view(request):
+            routes.append(self.router.db_for_read(Post))
+            if write:
+                self.router.db_for_write(Post)
+                routes.append(self.router.db_for_read(Post))
+            return HttpResponse()
+
+        response = ReplicaMiddleware(view)(request)
+        return routes, response
+
+    # чтение с реплики только в безопасных запросах без закрепления
+    def test_reads_routing(self):
+        routes, response = self.run_view(self.factory.get('/'))
+        self.assertEqual(routes, ['replica1'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        routes, _ = self.run_view(self.factory.post('/'))
+        self.assertEqual(routes, [None])
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        routes, _ = self.run_view(request)
+        self.assertEqual(routes, [None])
+        self.assertIsNone(self.router.db_for_read(Post))
+
+    # после записи чтения идут в default, а пользователь закрепляется
+    def test_write_pins_primary(self):
+        routes, response = self.run_view(self.factory.get('/'), write=True)
+        self.assertEqual(routes, ['replica1', None])
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+
+
+@override_settings(SQLITE_BUSY_BACKOFF=0)
+class RetryOnBusyTest(TestCase):
+    # занятая база — повтор всей view, прочие ошибки не глотаются
+    def test_retry(self):
+        calls = []
+
+        @retry_on_busy
+        def view(request):
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return HttpResponse('ok')
+
+        self.assertEqual(view(None).content, b'ok')
+        self.assertEqual(len(calls), 3)
+
+        @retry_on_busy
+        def broken(request):
+            calls.append(1)
+            raise OperationalError('no such table: posts_post')
+
+        calls.clear()
+        with self.assertRaises(OperationalError):
+            broken(None)
+        self.assertEqual(len(calls), 1)
+
+
+class TemplateRenderingTest(TestCase):
+    # на длинной ленте — окно страниц, а не ссылка на каждую
+    def test_page_window(self):
+        paginator = Paginator(range(1000), 10)
+        self.assertEqual(page_window(paginator.page(1)), [1, 2, 3, None, 100])
+        self.assertEqual(page_window(paginator.page(50)), [1, None, 48, 49, 50, 51, 52, None, 100])
+        self.assertEqual(page_window(paginator.page(99)), [1, None, 97, 98, 99, 100])
+        self.assertEqual(page_window(Paginator(range(30), 10).page(2)), [1, 2, 3])
+
+    def test_warm_templates(self):
+        self.assertGreater(warm_templates(), 10)
+        user = User.objects.create(username='author')
+        for i in range(30):
+            Post.objects.create(text=f'post {i}', author=user)
+        response = Client().get(reverse('index'), {'page': 2})
+        self.assertContains(response, 'post 19')
+        self.assertContains(response, '&hellip;', count=0)
+        self.assertContains(response, '?page=3')
+
+
+class ApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='author')
+        self.group = Group.objects.create(title='g', slug='g', description='d')
+        self.auth_client = Client()
+        self.auth_client.force_login(self.user)
+        for i in range(12):
+            self.post = Post.objects.create(text=f'post {i}', author=self.user, group=self.group)
+
+    # лента по курсору, без HTML
+    def test_feed_pages(self):
+        response = Client().get(reverse('api_index'))
+        data = response.json()
+        self.assertEqual([p['text'] for p in data['results']], [f'post {i}' for i in range(11, 1, -1)])
+        self.assertEqual(data['results'][0]['author'], 'author')
+        self.assertEqual(data['results'][0]['group'], 'g')
+        data = Client().get(reverse('api_index'), {'cursor': data['next']}).json()
+        self.assertEqual([p['text'] for p in data['results']], ['post 1', 'post 0'])
+        self.assertIsNone(data['next'])
+        self.assertEqual(Client().get(reverse('api_follow_index')).status_code, 401)
+
+    # неизвестная группа или автор — 404, как у HTML; картинка — через хранилище поля
+    def test_group_and_image(self):
+        response = Client().get(reverse('api_group', kwargs={'slug': 'missing'}))
+        self.assertEqual(response.status_code, 404)
+        response = self.auth_client.get(reverse('api_profile', kwargs={'username': 'missing'}))
+        self.assertEqual(response.status_code, 404)
+        response = self.auth_client.get(reverse('api_profile', kwargs={'username': 'author'}))
+        self.assertEqual(len(response.json()['results']), settings.POSTS_PER_PAGE)
+        Post.objects.filter(pk=self.post.pk).update(image='posts/ab/abcdef.webp')
+        data = Client().get(reverse('api_group', kwargs={'slug': 'g'})).json()
+        self.assertEqual(
+            data['results'][0]['image'], Post.objects.get(pk=self.post.pk).image.url
+        )
+
+    # неизменившаяся лента — 304 без выборки страницы, изменение — новый ETag
+    def test_conditional_get(self):
+        url = reverse('api_group', kwargs={'slug': 'g'})
+        response = Client().get(url)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            response = Client().get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(text='new', author=self.user, group=self.group)
+        response = Client().get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_post_comments(self):
+        kwargs = {'username': 'author', 'post_id': self.post.pk}
+        response = self.auth_client.get(reverse('api_post', kwargs=kwargs))
+        etag = response['ETag']
+        self.assertEqual(response.json()['comments']['results'], [])
+        Comments.objects.create(post=self.post, author=self.user, text='c')
+        response = self.auth_client.get(reverse('api_post', kwargs=kwargs), HTTP_IF_NONE_MATCH=etag)
+        data = response.json()
+        self.assertEqual(data['post']['comment_count'], 1)
+        self.assertEqual(data['comments']['results'][0]['text'], 'c')
+
+
+class ConditionalPagesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        self.post = Post.objects.create(text='text', author=self.author)
+        self.auth_client = Client()
+        self.auth_client.force_login(self.reader)
+
+    # повтор без изменений — 304 без рендера и без запросов к базе
+    def test_index_not_modified(self):
+        response = Client().get(reverse('index'))
+        with self.assertNumQueries(0):
+            response = Client().get(reverse('index'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(text='new', author=self.author)
+        response = Client().get(reverse('index'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    # страница зависит от зрителя и его подписок
+    def test_profile_depends_on_viewer(self):
+        url = reverse('profile', kwargs={'username': 'author'})
+        etag = self.auth_client.get(url)['ETag']
+        self.assertEqual(self.auth_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        author_client = Client()
+        author_client.force_login(self.author)
+        self.assertEqual(author_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.auth_client.get(reverse('profile_follow', kwargs={'username': 'author'}))
+        response = self.auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['following'])
+
+    def test_post_view_comments(self):
+        url = reverse('post', kwargs={'username': 'author', 'post_id': self.post.pk})
+        # первый ответ ставит csrf-cookie, с ней у страницы другой ETag
+        self.auth_client.get(url)
+        etag = self.auth_client.get(url)['ETag']
+        self.assertEqual(self.auth_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Comments.objects.create(post=self.post, author=self.reader, text='c')
+        self.assertEqual(self.auth_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+    # версию сменил другой процесс: ни одного устаревшего 304
+    def test_version_bumped_by_other_process(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = {'BACKEND': 'yatube.cache.SharedFileCache', 'LOCATION': directory.name}
+        other_process = SharedFileCache(directory.name, {})
+        url = reverse('profile', kwargs={'username': 'author'})
+        with self.settings(CACHES={**settings.CACHES, 'default': shared}):
+            etag = self.auth_client.get(url)['ETag']
+            self.assertEqual(self.auth_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            other_process.set(FEED_VERSION_KEY.format('author:author'), time.time_ns(), timeout=None)
+            response = self.auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+class ImageUploadTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['stats'].clear()
+        self.user = User.objects.create(username='author')
+        self.auth_client = Client()
+        self.auth_client.force_login(self.user)
+
+    def camera_jpeg(self, size=(3000, 1000)):
+        image = PILImage.new('RGB', size, (200, 30, 30))
+        exif = PILImage.Exif()
+        exif[0x0112] = 6  # снято повёрнутым на 90°
+        exif[0x010F] = 'Camera'
+        output = BytesIO()
+        image.save(output, 'JPEG', quality=95, exif=exif)
+        return SimpleUploadedFile('photo.jpg', output.getvalue(), content_type='image/jpeg')
+
+    # оригинал уменьшен, повёрнут по EXIF, без метаданных и в webp
+    def test_upload_processed(self):
+        upload = self.camera_jpeg()
+        self.auth_client.post(reverse('new_post'), {'text': 'photo', 'image': upload})
+        post = Post.objects.get()
+        self.assertTrue(post.image.name.endswith('.webp'))
+        with PILImage.open(post.image.path) as stored:
+            self.assertEqual(stored.format, 'WEBP')
+            self.assertEqual(stored.size, (683, 2048))
+            self.assertFalse(stored.getexif())
+        self.assertEqual(images.stats()['images'], 1)
+        self.assertGreater(images.stats()['saved'], 0)
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=1000 * 1000)
+    def test_too_many_pixels_rejected(self):
+        response = self.auth_client.post(
+            reverse('new_post'), {'text': 'photo', 'image': self.camera_jpeg()}
+        )
+        self.assertFalse(Post.objects.exists())
+        self.assertIn('image', response.context['form'].errors)
+
+    # лишнее сверх лимита не буферизуется, форма отвечает ошибкой размера
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=1000)
+    def test_too_large_stopped_while_streaming(self):
+        response = self.auth_client.post(
+            reverse('new_post'), {'text': 'photo', 'image': self.camera_jpeg()}
+        )
+        self.assertFalse(Post.objects.exists())
+        upload = response.wsgi_request.FILES['image']
+        self.assertIsInstance(upload, images.TooLargeUpload)
+        self.assertGreater(upload.size, 1000)
+        self.assertIn('Файл больше', response.context['form'].errors['image'][0])
+
+    # команда суммирует загрузки всех воркеров
+    def test_stats_shared_between_processes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = {'BACKEND': 'yatube.cache.SharedFileCache', 'LOCATION': directory.name}
+        with self.settings(CACHES={**settings.CACHES, 'stats': shared}):
+            images.process(self.camera_jpeg())
+            other_process = SharedFileCache(directory.name, {})
+            other_process.incr(images.STATS_KEY.format('images'), 2)
+            out = StringIO()
+            call_command('image_upload_stats', stdout=out)
+        self.assertIn('Картинок: 3', out.getvalue())
+
+    # MPO с камеры — не анимация: уменьшен, без EXIF и геопозиции
+    def test_mpo_processed_as_jpeg(self):
+        exif = PILImage.Exif()
+        exif[0x010F] = 'Camera'
+        exif[0x8825] = {2: (55.0, 45.0, 0.0)}  # GPS
+        output = BytesIO()
+        PILImage.new('RGB', (3000, 1000), (200, 30, 30)).save(
+            output, 'MPO', save_all=True, exif=exif,
+            append_images=[PILImage.new('RGB', (3000, 1000))],
+        )
+        result = images.process(SimpleUploadedFile('photo.jpg', output.getvalue(), 'image/jpeg'))
+        with PILImage.open(result) as stored:
+            self.assertEqual(stored.format, 'WEBP')
+            self.assertEqual(stored.size, (2048, 683))
+            self.assertFalse(stored.getexif())
+
+    # анимация остаётся как есть
+    def test_animation_kept(self):
+        output = BytesIO()
+        frames = [PILImage.new('RGB', (20, 20), color) for color in ('red', 'blue')]
+        frames[0].save(output, 'GIF', save_all=True, append_images=frames[1:])
+        upload = SimpleUploadedFile('anim.gif', output.getvalue(), 'image/gif')
+        self.assertIs(images.process(upload), upload)
+
+    # профиль CMYK не достаётся RGB-данным, RGB-профиль сохраняется
+    def test_icc_profile_follows_mode(self):
+        srgb = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+        for mode, kept in (('CMYK', False), ('RGB', True)):
+            output = BytesIO()
+            PILImage.new(mode, (50, 50)).save(output, 'JPEG', icc_profile=srgb)
+            result = images.process(
+                SimpleUploadedFile('photo.jpg', output.getvalue(), 'image/jpeg')
+            )
+            with PILImage.open(result) as stored:
+                self.assertEqual('icc_profile' in stored.info, kept)
+
+
+class MediaStorageTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create(username='author')
+
+    def upload(self, name='meme.png', color=(255, 0, 0)):
+        output = BytesIO()
+        PILImage.new('RGB', (20, 20), color).save(output, 'PNG')
+        return ContentFile(output.getvalue(), name=name)
+
+    # одинаковые картинки — один файл и счётчик ссылок
+    def test_duplicates_stored_once(self):
+        first = Post.objects.create(text='1', author=self.user, image=self.upload('a.png'))
+        second = Post.objects.create(text='2', author=self.user, image=self.upload('b.png'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(len(os.listdir(os.path.dirname(first.image.path))), 1)
+        self.assertEqual(MediaBlob.objects.get(name=first.image.name).refcount, 2)
+        # превью общее для копий
+        thumbnails.generate(first.pk)
+        self.assertIsNotNone(thumbnails.lookup(second.image))
+        path = first.image.path
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(MediaBlob.objects.exists())
+
+    # старые файлы переименовываются по хэшу, копии удаляются
+    def test_dedupe_command(self):
+        legacy = FileSystemStorage()
+        names = [legacy.save(f'posts/copy{i}.png', self.upload()) for i in range(3)]
+        Post.objects.bulk_create(
+            Post(text=str(i), author=self.user, image=name) for i, name in enumerate(names)
+        )
+        # старые файлы удаляются только после коммита
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            call_command('dedupe_media', stdout=StringIO())
+            self.assertTrue(all(legacy.exists(old) for old in names))
+        self.assertEqual(len(callbacks), 3)
+        images = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(images), 1)
+        name = images.pop()
+        self.assertTrue(legacy.exists(name))
+        self.assertFalse(any(legacy.exists(old) for old in names))
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 3)
+
+
+@override_settings(THUMBNAIL_KVSTORE_LRU_SIZE=100)
+class ThumbnailKVStoreTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=self.media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(sorl_default.kvstore.clear)
+        user = User.objects.create(username='author')
+        for i in range(3):
+            output = BytesIO()
+            PILImage.new('RGB', (20, 20), (i, 0, 0)).save(output, 'PNG')
+            post = Post.objects.create(
+                text=str(i), author=user, image=ContentFile(output.getvalue(), name='p.png')
+            )
+            thumbnails.generate(post.pk)
+
+    def kvstore_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = Client().get(reverse('index'))
+        self.assertEqual(response.content.count(b'/cache/'), 3)
+        return [q for q in captured if 'thumbnail_kvstore' in q['sql']]
+
+    # превью страницы — не больше одного запроса к БД, повтор — из памяти
+    def test_page_batch_lookup(self):
+        cache.clear()
+        sorl_default.kvstore._lru.clear()
+        self.assertEqual(len(self.kvstore_queries()), 1)
+        cache.clear()
+        self.assertEqual(len(self.kvstore_queries()), 0)
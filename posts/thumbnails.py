@@ -0,0 +1,126 @@
+"""Фоновая генерация превью картинок постов.
+
+Шаблоны не вызывают {% thumbnail %} (он декодирует и ужимает картинку
+прямо в запросе), а спрашивают у хранилища sorl готовое превью. Пока его
+нет, показывается оригинал, а генерация уходит в пул потоков.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import connections, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from . import caching, cards
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def _options(source, options):
+    # те же опции по умолчанию, что добавляет ThumbnailBackend.get_thumbnail,
+    # иначе имя файла превью не совпадёт
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def thumbnail_key(image, size='feed'):
+    geometry, options = settings.POST_THUMBNAILS[size]
+    source = ImageFile(image)
+    name = default.backend._get_thumbnail_filename(
+        source, geometry, _options(source, options)
+    )
+    return ImageFile(name, default.storage)
+
+
+def lookup(image, size='feed'):
+    """Готовое превью или None, ничего не генерирует."""
+    return default.kvstore.get(thumbnail_key(image, size))
+
+
+def source_exists(image):
+    # файла нет (удалён, не доехал, путь вне MEDIA_ROOT) — превью не из чего
+    try:
+        return image.storage.exists(image.name)
+    except (OSError, SuspiciousFileOperation):
+        return False
+
+
+def prefetch(posts, size='feed'):
+    """Загружает превью постов из KV пачкой, дальше lookup() берёт их из LRU."""
+    get_many = getattr(default.kvstore, 'get_many', None)
+    keys = [thumbnail_key(post.image, size) for post in posts if post.image]
+    if get_many is not None and keys:
+        get_many(keys)
+
+
+def generate(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    for geometry, options in settings.POST_THUMBNAILS.values():
+        default.backend.get_thumbnail(post.image, geometry, **options)
+    if any(lookup(post.image, size) is None for size in settings.POST_THUMBNAILS):
+        # sorl не смог прочитать исходник и ничего не сохранил: сбрасывать
+        # ленты незачем, иначе каждый показ поста обнулял бы их кэш
+        logger.warning('Превью для поста %s не сделано', post_id)
+        return
+    # карточки и страницы с оригиналом вместо превью больше не нужны
+    cards.bump(post.pk)
+    caching.invalidate_feeds((post.group_id,), (post.author_id,))
+
+
+def _executor_instance():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def _run(post_id):
+    try:
+        generate(post_id)
+    except Exception:
+        logger.exception('Не удалось сделать превью для поста %s', post_id)
+    finally:
+        with _lock:
+            _pending.discard(post_id)
+        connections.close_all()
+
+
+def schedule(post_id):
+    """Ставит генерацию превью в очередь после коммита транзакции.
+
+    При THUMBNAIL_WORKERS = 0 превью делается сразу в этом потоке.
+    """
+    def submit():
+        if not settings.THUMBNAIL_WORKERS:
+            generate(post_id)
+            return
+        with _lock:
+            if post_id in _pending:
+                return
+            _pending.add(post_id)
+        _executor_instance().submit(_run, post_id)
+    transaction.on_commit(submit)
@@ -0,0 +1,166 @@
+"""Лента подписок, материализованная при записи (fan-out on write).
+
+При публикации пост раскладывается по TimelineEntry всех подписчиков
+автора. Посты авторов, у которых подписчиков больше
+TIMELINE_FANOUT_LIMIT, не рассылаются (fanned_out=False) и
+подмешиваются в ленту при чтении.
+
+Страница ленты — два диапазона по индексам: записи пользователя по
+(user, -pub_date, -post) и неразосланные посты его авторов по
+частичному (author, -pub_date, -id), каждый не длиннее страницы.
+Они сливаются в памяти, посты страницы читаются одним запросом по id.
+
+Новая подписка дозаполняет ленту уже разосланными постами автора после
+коммита, в фоновом потоке (schedule_backfill): запрос подписки не ждёт
+копирования и не держит на нём блокировку записи.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .models import Follow, Post, TimelineEntry
+from .pagination import PREVIOUS, keyset
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def fan_out(post):
+    # подписчики — из базы, а не из графа: граф другого процесса может
+    # ещё не знать о свежей подписке, и пост пропал бы из её ленты
+    followers = list(
+        Follow.objects.filter(author_id=post.author_id)
+        .values_list('user_id', flat=True)[:settings.TIMELINE_FANOUT_LIMIT + 1]
+    )
+    if len(followers) > settings.TIMELINE_FANOUT_LIMIT:
+        return False
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=post.pk, pub_date=post.pub_date)
+            for user_id in followers
+        ],
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    Post.objects.filter(pk=post.pk).update(fanned_out=True)
+    post.fanned_out = True
+    return True
+
+
+def backfill(user_id, author_id):
+    # новая подписка: добавляем в ленту уже разосланные посты автора,
+    # остальные и так подмешиваются при чтении. Пачками от новых к старым,
+    # каждая своей записью: база не блокируется на всё время копирования
+    last = None
+    while True:
+        posts = Post.objects.filter(author_id=author_id, fanned_out=True)
+        if last is not None:
+            posts = posts.filter(pk__lt=last)
+        rows = list(
+            posts.order_by('-pk').values_list('pk', 'pub_date')[:settings.TIMELINE_BATCH_SIZE]
+        )
+        if not rows:
+            return
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+                for post_id, pub_date in rows
+            ],
+            ignore_conflicts=True,
+        )
+        # отписка, закоммиченная до этой пачки, её уже не вычистила
+        if not Follow.objects.filter(user_id=user_id, author_id=author_id).exists():
+            trim(user_id, author_id)
+            return
+        last = rows[-1][0]
+
+
+def _executor_instance():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.TIMELINE_BACKFILL_WORKERS,
+            thread_name_prefix='backfill',
+        )
+    return _executor
+
+
+def _run(user_id, author_id):
+    try:
+        backfill(user_id, author_id)
+    except Exception:
+        logger.exception('Не удалось заполнить ленту %s постами %s', user_id, author_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_backfill(user_id, author_id):
+    """Заполняет ленту после коммита подписки, вне транзакции запроса.
+
+    При TIMELINE_BACKFILL_WORKERS = 0 — сразу в этом потоке.
+    """
+    def submit():
+        if not settings.TIMELINE_BACKFILL_WORKERS:
+            backfill(user_id, author_id)
+            return
+        _executor_instance().submit(_run, user_id, author_id)
+    transaction.on_commit(submit)
+
+
+def trim(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, post__author_id=author_id).delete()
+
+
+class Feed:
+    """Лента подписок для paginate(): срезы для номеров страниц,
+    keyset() для курсора; values() — строки вместо моделей (API)."""
+
+    def __init__(self, user, fields=None):
+        self.user = user
+        self.fields = fields
+
+    def values(self, *fields):
+        return Feed(self.user, fields)
+
+    def _sources(self):
+        inbox = TimelineEntry.objects.filter(user=self.user)
+        # подзапрос, а не список id: подписок могут быть тысячи
+        pulled = Post.objects.filter(
+            fanned_out=False,
+            author__in=Follow.objects.filter(user=self.user).values('author_id'),
+        )
+        return (inbox, 'post_id'), (pulled, 'id')
+
+    def _ids(self, limit, direction=None, value=None, pk=None):
+        keys = set()
+        for queryset, key in self._sources():
+            rows = keyset(queryset, 'pub_date', key, direction, value, pk)
+            keys.update(rows.values_list('pub_date', key)[:limit])
+        keys = sorted(keys, reverse=direction != PREVIOUS)[:limit]
+        return [post_id for _, post_id in keys]
+
+    def _posts(self, ids):
+        posts = Post.objects.for_feed().filter(pk__in=ids)
+        if self.fields:
+            by_id = {row['id']: row for row in posts.values(*self.fields)}
+        else:
+            by_id = {post.pk: post for post in posts}
+        return [by_id[post_id] for post_id in ids if post_id in by_id]
+
+    def keyset(self, direction, value, pk, limit):
+        return self._posts(self._ids(limit, direction, value, pk))
+
+    def count(self):
+        return sum(queryset.count() for queryset, _ in self._sources())
+
+    def __getitem__(self, index):
+        # Paginator просит только срезы [bottom:top]
+        start = index.start or 0
+        return self._posts(self._ids(index.stop)[start:])
+
+
+def feed(user):
+    return Feed(user)
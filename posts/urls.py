@@ -1,12 +1,20 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     # Просмотр группы
     path("follow/", views.follow_index, name="follow_index"),
     path("group/<slug:slug>/", views.group_posts, name='group'),
+    # Поиск по постам
+    path("search/", views.search_posts, name="search"),
     # Создание поста
     path("new/", views.new_post, name="new_post"),
+    # JSON API лент и поста (только чтение)
+    path("api/posts/", api.index, name="api_index"),
+    path("api/group/<slug:slug>/", api.group_posts, name="api_group"),
+    path("api/follow/", api.follow_index, name="api_follow_index"),
+    path("api/users/<str:username>/", api.profile, name="api_profile"),
+    path("api/users/<str:username>/<int:post_id>/", api.post_view, name="api_post"),
     # Главная страница
     path('', views.index, name='index'),
     # Профайл пользователя
@@ -15,8 +23,11 @@ urlpatterns = [
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
     path('<str:username>/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path("<username>/<int:post_id>/comment", views.add_comment, name="add_comment"),
+    path("<str:username>/<int:post_id>/comments/", views.post_comments, name="post_comments"),
     path("<str:username>/follow/", views.profile_follow, name="profile_follow"),
     path("<str:username>/unfollow/", views.profile_unfollow, name="profile_unfollow"),
+    # Выгрузка постов и комментариев пользователя
+    path("<str:username>/export/", views.export_user_data, name="export_user_data"),
     path('404/', views.page_not_found),
     path('500/', views.server_error)
 ]
\ No newline at end of file
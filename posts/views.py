@@ -1,17 +1,26 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.core.exceptions import PermissionDenied
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.http import urlencode
 
 from groups.models import Group
 from .models import Post, User, Comments, Follow
+from . import conditional, counters, export, search, timeline
 from .forms import CreateComment, CreatePost
+from .caching import cache_anonymous_page
+from .follow_graph import graph as follow_graph
+from .pagination import CursorPaginator, paginate
+from yatube.sqlite import retry_on_busy
 
 
+@conditional.conditional(conditional.for_viewer(conditional.index))
+@cache_anonymous_page('index')
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)  # показывать по 10 записей на странице.
-    page_number = request.GET.get('page')  # переменная в URL с номером запрошенной страницы
-    page = paginator.get_page(page_number)  # получить записи с нужным смещением
+    post_list = Post.objects.for_feed()
+    # по номеру страницы (?page=) или по курсору (?cursor=)
+    page, paginator = paginate(request, post_list)
     return render(
         request,
         'index.html',
@@ -19,14 +28,13 @@ def index(request):
        )
 
 
-@login_required
+@conditional.conditional(conditional.for_viewer(conditional.group))
+@cache_anonymous_page('group:{slug}')
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = Post.objects.filter(group=group)
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')  # переменная в URL с номером запрошенной страницы
-    page = paginator.get_page(page_number)  # получить записи с нужным смещением
-    
+    post_list = Post.objects.for_feed().filter(group=group)
+    page, paginator = paginate(request, post_list)
+
     return render(
         request,
         "group.html",
@@ -38,7 +46,25 @@ def group_posts(request, slug):
         )
 
 
+def search_posts(request):
+    query = request.GET.get('q', '').strip()
+    post_list = search.search(Post.objects.for_feed(), query)
+    # выдача упорядочена по релевантности, поэтому только номера страниц
+    page, paginator = paginate(request, post_list, allow_cursor=False)
+    return render(
+        request,
+        'search.html',
+        {
+            'query': query,
+            'query_prefix': urlencode({'q': query}) + '&',
+            'page': page,
+            'paginator': paginator,
+            }
+        )
+
+
 @login_required
+@retry_on_busy
 def new_post(request):
     form = CreatePost(request.POST or None, files=request.FILES or None)
     if form.is_valid():
@@ -54,18 +80,18 @@ def new_post(request):
 
 
 @login_required
+@conditional.conditional(conditional.for_viewer(conditional.profile))
 def profile(request, username):
     profile_user = get_object_or_404(User, username=username)
-    follow_status = Follow.objects.filter(author=profile_user).exists()
-    post_list = Post.objects.filter(author=profile_user)
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')  # переменная в URL с номером запрошенной страницы
-    page = paginator.get_page(page_number)
+    follow_status = follow_graph.is_following(request.user.pk, profile_user.pk)
+    post_list = Post.objects.for_feed().filter(author=profile_user)
+    page, paginator = paginate(request, post_list)
     return render(
         request,
         'profile.html',
         {
             "profile_user": profile_user,
+            "counters": counters.for_user(profile_user),
             "page": page,
             'paginator': paginator,
             'following': follow_status,
@@ -74,16 +100,18 @@ def profile(request, username):
  
  
 @login_required
+@conditional.conditional(conditional.for_viewer(conditional.post))
 def post_view(request, username, post_id):
     profile_user = get_object_or_404(User, username=username)
     current_post = get_object_or_404(Post,pk=post_id)
-    comments = Comments.objects.filter(post=current_post)
+    comments = comments_page(current_post, None)
     form = CreateComment(instance=None)
     return render(
         request,
         'post.html',
         {
             "profile_user": profile_user,
+            "counters": counters.for_user(profile_user),
             "current_post": current_post,
             'comments': comments,
             'form': form
@@ -91,7 +119,29 @@ def post_view(request, username, post_id):
         )
 
 
+def comments_page(post, cursor):
+    # комментарии с авторами одним запросом, по курсору от новых к старым
+    comments = Comments.objects.filter(post=post).select_related('author')
+    paginator = CursorPaginator(comments, settings.COMMENTS_PER_PAGE, field='created')
+    return paginator.get_page(cursor)
+
+
+@login_required
+def post_comments(request, username, post_id):
+    # следующая порция комментариев без остальной страницы
+    post = get_object_or_404(Post, id=post_id, author__username=username)
+    return render(
+        request,
+        'comments_list.html',
+        {
+            'current_post': post,
+            'comments': comments_page(post, request.GET.get('cursor')),
+            }
+        )
+
+
 @login_required
+@retry_on_busy
 def post_edit(request, username, post_id):
     post = get_object_or_404(Post, id=post_id, author__username=username)
     if post.author != request.user:
@@ -115,42 +165,48 @@ def post_edit(request, username, post_id):
         )
 
 
+@login_required
+@retry_on_busy
 def add_comment(request, username, post_id):
     post = get_object_or_404(Post,id=post_id, author__username=username)
     form = CreateComment(request.POST or None)
+    ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
     if form.is_valid():
         comment = form.save(commit=False)
         comment.post = post
         comment.author = request.user
         comment.save()
+        if ajax:
+            # только новый комментарий, страница дописывает его сама
+            return render(
+                request, 'comment_item.html', {'comment': comment}, status=201
+            )
         return redirect('post', username=username, post_id=post_id)
-    return render(
-        request,
-        'post.html',
-        {'form': form}
-        )
+    if ajax and request.method == 'POST':
+        return JsonResponse({'errors': form.errors}, status=400)
+    return redirect('post', username=username, post_id=post_id)
+
 
 @login_required
 def follow_index(request):
-    user_follows = User.objects.get(pk=request.user.id).follower.all().values_list('author')
-    post_list = Post.objects.filter(author__in=user_follows)
-    paginator = Paginator(post_list, 10)  # показывать по 10 записей на странице.
-    page_number = request.GET.get('page')  # переменная в URL с номером запрошенной страницы
-    page = paginator.get_page(page_number)  # получить записи с нужным смещением
+    # лента собрана заранее при публикации, см. posts.timeline
+    post_list = timeline.feed(request.user)
+    page, paginator = paginate(request, post_list)
     return render(request, "follow.html", {'page': page, 'paginator': paginator})
 
 
 @login_required
+@retry_on_busy
 def profile_follow(request, username):
     profile_user = get_object_or_404(User, username=username)
-    follow_status = Follow.objects.filter(author=profile_user).exists()
-    if profile_user == request.user or follow_status == True:
-        return redirect('profile', username=username)
-    Follow.objects.create(user=request.user, author=profile_user)
+    # проверяем по базе: граф этого процесса может отставать
+    if profile_user != request.user:
+        Follow.objects.get_or_create(user=request.user, author=profile_user)
     return redirect('profile', username=username)
 
 
 @login_required
+@retry_on_busy
 def profile_unfollow(request, username):
     profile_user = get_object_or_404(User, username=username)
     un_follow = get_object_or_404(Follow, user=request.user, author=profile_user)
@@ -158,6 +214,24 @@ def profile_unfollow(request, username):
     return redirect('profile', username=username)
 
 
+@login_required
+def export_user_data(request, username):
+    profile_user = get_object_or_404(User, username=username)
+    if profile_user != request.user and not request.user.is_staff:
+        raise PermissionDenied
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in export.FORMATS:
+        export_format = 'ndjson'
+    response = StreamingHttpResponse(
+        export.lines(profile_user, export_format),
+        content_type=export.FORMATS[export_format],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{profile_user.username}.{export_format}"'
+    )
+    return response
+
+
 def page_not_found(request, exception):
     return render(
         request,
@@ -1,3 +1,13 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import QueuedEmail
+
+
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ("pk", "created", "attempts", "next_attempt", "last_error")
+    list_filter = ("created",)
+    exclude = ("message",)
+    empty_value_display = "-пусто-"
+
+
+admin.site.register(QueuedEmail, QueuedEmailAdmin)
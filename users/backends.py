@@ -0,0 +1,37 @@
+"""Бэкенд авторизации с кэшированным пользователем.
+
+AuthenticationMiddleware на каждом запросе достаёт пользователя по id
+из сессии — лишний SELECT из auth_user перед любой вьюхой. Здесь
+пользователь берётся из кэша AUTH_USER_CACHE, общего для всех процессов
+(как и сессии). Запись сбрасывается при сохранении и удалении
+пользователя (users.signals), в том числе при смене пароля, блокировке
+и обновлении last_login, — сразу и ещё раз после коммита, чтобы
+параллельный запрос не положил в кэш незакоммиченное старое состояние.
+Правки через QuerySet.update() сигналов не шлют: после них нужно
+вызвать invalidate_user, иначе запись доживёт до AUTH_USER_CACHE_TIMEOUT.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+USER_KEY = 'auth_user:{}'
+
+
+def user_cache():
+    return caches[settings.AUTH_USER_CACHE]
+
+
+def invalidate_user(user_id):
+    user_cache().delete(USER_KEY.format(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = USER_KEY.format(user_id)
+        cache = user_cache()
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user
@@ -0,0 +1,96 @@
+"""Очередь исходящих писем.
+
+QueuedEmailBackend не отправляет письма, а складывает их в таблицу
+QueuedEmail — в той же транзакции, что и запрос, без сети и диска в
+ответе. Команда send_queued_mail забирает письма пачками и отправляет
+через один открытый EMAIL_QUEUE_BACKEND; неудачные повторяются с
+растущей паузой, пока не кончатся EMAIL_QUEUE_MAX_ATTEMPTS.
+
+Пачка забирается одним UPDATE: строки помечаются токеном воркера, а
+next_attempt сдвигается на EMAIL_QUEUE_LEASE — другие воркеры их не
+видят. Отправка идёт вне транзакции, отправленные удаляются после.
+Упавший воркер не теряет письма: аренда истечёт, и их заберут снова.
+"""
+import logging
+import pickle
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.utils import timezone
+
+from .models import QueuedEmail
+
+logger = logging.getLogger(__name__)
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        rows = []
+        for message in email_messages:
+            # соединение в письме — это мы сами, оно не сериализуется
+            message.connection = None
+            rows.append(QueuedEmail(
+                message=pickle.dumps(message), next_attempt=timezone.now()
+            ))
+        QueuedEmail.objects.bulk_create(rows)
+        return len(rows)
+
+
+def claim(batch_size):
+    """Берёт в аренду пачку писем, которым пора уходить."""
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = QueuedEmail.objects.filter(next_attempt__lte=now).order_by('pk')
+    # условие повторяется снаружи: строку, которую успел забрать другой
+    # воркер, UPDATE перепроверит и пропустит
+    QueuedEmail.objects.filter(
+        pk__in=due.values('pk')[:batch_size], next_attempt__lte=now
+    ).update(
+        claim=token,
+        next_attempt=now + timedelta(seconds=settings.EMAIL_QUEUE_LEASE),
+    )
+    return list(QueuedEmail.objects.filter(claim=token))
+
+
+def send_batch(batch_size=None):
+    """Отправляет одну пачку писем, возвращает (отправлено, с ошибкой)."""
+    rows = claim(batch_size or settings.EMAIL_QUEUE_BATCH_SIZE)
+    if not rows:
+        return 0, 0
+    sent, failed = [], []
+    connection = get_connection(settings.EMAIL_QUEUE_BACKEND)
+    try:
+        connection.open()
+    except Exception as error:
+        # сервер недоступен — вся пачка ждёт следующей попытки
+        failed = [(row, error) for row in rows]
+    else:
+        try:
+            for row in rows:
+                try:
+                    connection.send_messages([pickle.loads(row.message)])
+                except Exception as error:
+                    failed.append((row, error))
+                else:
+                    sent.append(row.pk)
+        finally:
+            connection.close()
+    QueuedEmail.objects.filter(pk__in=sent).delete()
+    now = timezone.now()
+    for row, error in failed:
+        row.attempts += 1
+        row.last_error = repr(error)
+        row.claim = ''
+        if row.attempts >= settings.EMAIL_QUEUE_MAX_ATTEMPTS:
+            row.next_attempt = None
+            logger.error('Письмо %s не отправлено: %r', row.pk, error)
+        else:
+            delay = settings.EMAIL_QUEUE_RETRY_DELAY * 2 ** (row.attempts - 1)
+            row.next_attempt = now + timedelta(seconds=delay)
+    QueuedEmail.objects.bulk_update(
+        [row for row, _ in failed], ['attempts', 'last_error', 'claim', 'next_attempt']
+    )
+    return len(sent), len(failed)
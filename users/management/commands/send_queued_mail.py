@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.email import send_batch
+
+
+class Command(BaseCommand):
+    help = 'Отправляет письма из очереди пачками через одно соединение'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--loop', action='store_true',
+                            help='не выходить, а опрашивать очередь')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='пауза между опросами пустой очереди, с')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = send_batch(options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent:
+                self.stdout.write(f'Отправлено: {sent}, с ошибкой: {failed}')
+            if not sent:
+                # пусто или всё упало: ждём, а не крутимся вхолостую
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        self.stdout.write(f'Итого отправлено: {total_sent}, с ошибкой: {total_failed}')
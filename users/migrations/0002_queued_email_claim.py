@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_queued_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuedemail',
+            name='claim',
+            field=models.CharField(blank=True, db_index=True, max_length=32),
+        ),
+    ]
@@ -1,3 +1,20 @@
 from django.db import models
 
-# Create your models here.
+
+class QueuedEmail(models.Model):
+    """Письмо в очереди на отправку (см. users.email)."""
+    # сериализованный pickle EmailMessage со всеми вложениями
+    message = models.BinaryField()
+    created = models.DateTimeField(auto_now_add=True)
+    # None — попытки исчерпаны, письмо ждёт разбора в админке
+    next_attempt = models.DateTimeField(null=True, db_index=True)
+    # воркер, взявший письмо; next_attempt тем временем — конец аренды
+    claim = models.CharField(max_length=32, blank=True, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['pk']
+
+    def __str__(self):
+        return f'Письмо {self.pk} (попыток: {self.attempts})'
@@ -1,3 +1,146 @@
-from django.test import TestCase
+import os
+import tempfile
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .backends import USER_KEY, CachedModelBackend
+from .email import claim, send_batch
+from .models import QueuedEmail
+
+
+class FailingBackend(locmem.EmailBackend):
+    """Отклоняет письма с адресатом bounce@…"""
+    def send_messages(self, messages):
+        for message in messages:
+            if any(to.startswith('bounce@') for to in message.to):
+                raise ConnectionError('отказ сервера')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='users.email.QueuedEmailBackend')
+class QueuedEmailTest(TestCase):
+    def setUp(self):
+        self.sink = tempfile.TemporaryDirectory()
+        self.addCleanup(self.sink.cleanup)
+
+    def test_send_mail_only_enqueues(self):
+        with self.assertNumQueries(1):
+            sent = mail.send_mass_mail([
+                ('Тема', 'Текст', 'from@yatube.ru', [f'user{i}@yatube.ru'])
+                for i in range(3)
+            ])
+        self.assertEqual(sent, 3)
+        self.assertEqual(QueuedEmail.objects.count(), 3)
+
+    def test_worker_delivers_batch_to_file_sink(self):
+        for i in range(3):
+            mail.send_mail('Тема', f'Письмо {i}', 'from@yatube.ru', ['to@yatube.ru'])
+        with self.settings(
+            EMAIL_QUEUE_BACKEND='django.core.mail.backends.filebased.EmailBackend',
+            EMAIL_FILE_PATH=self.sink.name,
+        ):
+            call_command('send_queued_mail', stdout=StringIO())
+        self.assertFalse(QueuedEmail.objects.exists())
+        # одно соединение на пачку — один файл со всеми письмами
+        files = os.listdir(self.sink.name)
+        self.assertEqual(len(files), 1)
+        with open(os.path.join(self.sink.name, files[0])) as log:
+            content = log.read()
+        for i in range(3):
+            self.assertIn(f'Письмо {i}', content)
+
+    @override_settings(
+        EMAIL_QUEUE_BACKEND='users.tests.FailingBackend',
+        EMAIL_QUEUE_MAX_ATTEMPTS=2,
+    )
+    def test_failed_message_is_retried_then_parked(self):
+        mail.send_mail('Тема', 'ok', 'from@yatube.ru', ['to@yatube.ru'])
+        mail.send_mail('Тема', 'bounce', 'from@yatube.ru', ['bounce@yatube.ru'])
+        self.assertEqual(send_batch(), (1, 1))
+        self.assertEqual(len(mail.outbox), 1)
+        failed = QueuedEmail.objects.get()
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('отказ сервера', failed.last_error)
+        self.assertGreater(failed.next_attempt, timezone.now())
+        # до срока повтор не берётся
+        self.assertEqual(send_batch(), (0, 0))
+        QueuedEmail.objects.update(next_attempt=timezone.now())
+        self.assertEqual(send_batch(), (0, 1))
+        failed.refresh_from_db()
+        self.assertIsNone(failed.next_attempt)
+        self.assertEqual(send_batch(), (0, 0))
+
+    # пачки двух воркеров не пересекаются, упавший отдаёт свою по аренде
+    @override_settings(EMAIL_QUEUE_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_claims_do_not_overlap(self):
+        for i in range(3):
+            mail.send_mail('Тема', f'Письмо {i}', 'from@yatube.ru', ['to@yatube.ru'])
+        first = {row.pk for row in claim(2)}
+        second = {row.pk for row in claim(2)}
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse(first & second)
+        self.assertEqual(send_batch(), (0, 0))
+        # первый воркер упал: после аренды письма уходят
+        QueuedEmail.objects.filter(pk__in=first).update(next_attempt=timezone.now())
+        self.assertEqual(send_batch(), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class CachedAuthTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='reader')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def auth_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [
+            query['sql'] for query in queries
+            if 'django_session' in query['sql']
+            or query['sql'].startswith('SELECT "auth_user"')
+        ]
+
+    def test_warm_feed_request_skips_session_and_user(self):
+        url = reverse('follow_index')
+        self.auth_queries(url)
+        self.assertEqual(self.auth_queries(url), [])
+
+    def test_user_change_invalidates_cache(self):
+        backend = CachedModelBackend()
+        backend.get_user(self.user.pk)
+        self.user.first_name = 'Иван'
+        self.user.save()
+        self.assertEqual(backend.get_user(self.user.pk).first_name, 'Иван')
+        self.user.delete()
+        self.assertIsNone(backend.get_user(self.user.pk))
+
+    # кэш общий: сброс после сохранения виден и другому процессу
+    def test_invalidation_reaches_other_processes(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory.name,
+        }
+        key = USER_KEY.format(self.user.pk)
+        other_process = FileBasedCache(directory.name, {})
+        with self.settings(CACHES={'default': shared, 'auth': shared}):
+            CachedModelBackend().get_user(self.user.pk)
+            self.assertIsNotNone(other_process.get(key))
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.is_active = False
+                self.user.save()
+            self.assertIsNone(other_process.get(key))
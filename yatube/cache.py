@@ -0,0 +1,58 @@
+"""Файловый кэш, общий для процессов-воркеров.
+
+FileBasedCache Django делает add и incr как «прочитать, потом
+записать»: два процесса, увеличивающие один счётчик, теряют одно из
+увеличений, а incr ещё и сбрасывает срок жизни ключа на TIMEOUT по
+умолчанию (версии лент хранятся бессрочно). Здесь обе операции идут под
+файловой блокировкой, а incr сохраняет срок жизни ключа.
+"""
+import os
+import pickle
+import time
+import zlib
+from contextlib import contextmanager
+from hashlib import md5
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+
+# ключи раскладываются по стольким файлам блокировок
+LOCK_STRIPES = 16
+
+
+class SharedFileCache(FileBasedCache):
+
+    @contextmanager
+    def _locked(self, key, version):
+        key = self.make_and_validate_key(key, version=version)
+        stripe = int(md5(key.encode()).hexdigest(), 16) % LOCK_STRIPES
+        self._createdir()
+        # не .djcache: очистка и вытеснение файлы блокировок не трогают
+        path = os.path.join(self._dir, f'lock.{stripe}')
+        with open(path, 'ab') as lock:
+            locks.lock(lock, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(lock)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._locked(key, version):
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        with self._locked(key, version):
+            try:
+                with open(self._key_to_file(key, version), 'rb') as f:
+                    expiry = pickle.load(f)
+                    value = pickle.loads(zlib.decompress(f.read()))
+            except FileNotFoundError:
+                expiry, value = 0, None
+            if value is None or expiry is not None and expiry < time.time():
+                raise ValueError(f"Key '{key}' not found")
+            value += delta
+            # сохраняем оставшийся срок жизни ключа (None — бессрочно)
+            timeout = None if expiry is None else max(expiry - time.time(), 1)
+            self.set(key, value, timeout, version)
+            return value
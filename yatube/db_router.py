@@ -0,0 +1,74 @@
+"""Чтение с реплик, запись в основную базу.
+
+ReplicaMiddleware разрешает чтение с реплик только в безопасных запросах
+(GET, HEAD) пользователя, который недавно ничего не записывал. Как только
+в запросе что-то пишется в базу, остальные чтения этого запроса идут в
+default, а в ответ ставится cookie, которая на REPLICA_PIN_SECONDS
+закрепляет пользователя за основной базой: он сразу видит свои изменения,
+даже если реплика отстаёт.
+
+Реплики перечислены в DATABASE_REPLICAS; без них роутер ничего не меняет.
+"""
+import contextvars
+import random
+
+from django.conf import settings
+
+PIN_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = contextvars.ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    # изменяемый объект, а не значение contextvar: роутер отмечает запись
+    # и тогда, когда view выполняется в скопированном контексте
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        replicas = settings.DATABASE_REPLICAS
+        if state is None or not state.replica or state.wrote or not replicas:
+            return None
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # схема на реплики приходит вместе с данными основной базы
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState(
+            replica=request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES
+        )
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
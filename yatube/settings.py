@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -25,6 +26,9 @@ SECRET_KEY = '7(k#0+x*uk(80wsa8ce(5bc(g-cuh%o7u&o19xgt_%^)^^j%c%'
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# Запуск под тестами: фоновые потоки и прочее, что мешает тестовой базе
+TESTING = 'test' in sys.argv or 'pytest' in sys.modules
+
 ALLOWED_HOSTS = [
     "localhost",
     "127.0.0.1",
@@ -53,6 +57,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'posts.middleware.QueryMetricsMiddleware',
+    'yatube.db_router.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,8 +74,15 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # шаблоны компилируются один раз на процесс (прогрев — yatube.warmup);
+            # в разработке автоперезагрузка сбрасывает кэш при правке шаблона
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -90,9 +103,42 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # соединение переживает запрос: не открываем файл и не гоняем PRAGMA заново
+        'CONN_MAX_AGE': int(os.environ.get('YATUBE_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# PRAGMA для каждого нового соединения SQLite (см. yatube/sqlite.py)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    # в WAL режим normal не теряет целостность, только последние коммиты при сбое питания
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # отрицательное значение — в КиБ, т.е. 64 МБ кэша страниц
+    'cache_size': -64 * 1024,
+    'temp_store': 'memory',
+}
+# повторы транзакции записи при «database is locked» и начальная пауза, с
+SQLITE_BUSY_RETRIES = 5
+SQLITE_BUSY_BACKOFF = 0.02
+
+# Реплики только для чтения (см. yatube/db_router.py), через запятую:
+# YATUBE_REPLICAS=replica.sqlite3 и python manage.py sync_replicas —
+# локальная проверка на двух файлах SQLite
+DATABASE_REPLICAS = []
+for number, name in enumerate(filter(None, os.environ.get('YATUBE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['yatube.db_router.PrimaryReplicaRouter']
+# сколько секунд после записи пользователь читает только из default
+REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -140,10 +186,19 @@ LOGIN_URL = "/auth/login/"
 LOGIN_REDIRECT_URL = "index" 
 # LOGOUT_REDIRECT_URL = "index"
 
-#  подключаем движок filebased.EmailBackend
-EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
+# письма из запросов складываются в очередь, отправляет их
+# команда send_queued_mail через EMAIL_QUEUE_BACKEND
+EMAIL_BACKEND = "users.email.QueuedEmailBackend"
+#  доставка — движок filebased.EmailBackend
+EMAIL_QUEUE_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
+EMAIL_QUEUE_BATCH_SIZE = 100
+EMAIL_QUEUE_MAX_ATTEMPTS = 5
+# пауза перед повтором, с; удваивается с каждой попыткой
+EMAIL_QUEUE_RETRY_DELAY = 60
+# на столько воркер забирает пачку; дольше отправки любой пачки
+EMAIL_QUEUE_LEASE = 300
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
@@ -154,9 +209,127 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Версии лент, страницы, карточки постов, граф подписок и счётчики:
+# общий для всех процессов-воркеров, иначе пост, сохранённый в одном
+# процессе, не сбрасывает страницы и ETag в остальных. add и incr
+# атомарны между процессами (см. yatube.cache)
+CACHE_MAX_ENTRIES = 50000
+
 CACHES = {
     'default': {
+        'BACKEND': 'yatube.cache.SharedFileCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'default')
+        ),
+        'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES},
+    } if not TESTING else {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'OPTIONS': {'MAX_ENTRIES': CACHE_MAX_ENTRIES},
+    },
+    # сессии и пользователи: общий для всех процессов-воркеров, иначе
+    # выход, смена пароля или блокировка в одном процессе не видны в
+    # других. На файлах — база SQLite всё равно на одном хосте
+    'auth': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_AUTH_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'auth')
+        ),
+    } if not TESTING else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'auth',
+    },
+    # счётчики статистики (карточки, загрузки картинок): несколько ключей,
+    # которые не должны вытесняться вместе со страницами из default
+    'stats': {
+        'BACKEND': 'yatube.cache.SharedFileCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_STATS_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'stats')
+        ),
+    } if not TESTING else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'stats',
+    },
+}
+STATS_CACHE = 'stats'
+
+# сессия читается из кэша, пишется в кэш и в базу (переживает рестарт)
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'auth'
+
+AUTHENTICATION_BACKENDS = [
+    'users.backends.CachedModelBackend',
+    # сессии, открытые до появления кэша, ссылаются на этот бэкенд
+    'django.contrib.auth.backends.ModelBackend',
+]
+AUTH_USER_CACHE = 'auth'
+# пользователь сбрасывается из кэша при save() и delete(); срок
+# ограничивает жизнь записи после правок в обход сигналов (update())
+AUTH_USER_CACHE_TIMEOUT = 5 * 60
+
+
+# Лента: записей на странице и режим пагинации ('page' или 'cursor').
+# В режиме 'cursor' ссылки ?page=N продолжают работать.
+POSTS_PER_PAGE = 10
+FEED_PAGINATION = 'page'
+
+# Лента подписок: авторам с большим числом подписчиков посты не
+# рассылаются, а подмешиваются при чтении
+TIMELINE_FANOUT_LIMIT = 5000
+TIMELINE_BATCH_SIZE = 500
+# потоков, дозаполняющих ленту после новой подписки (0 — сразу после коммита)
+TIMELINE_BACKFILL_WORKERS = 0 if TESTING else 1
+
+# Срок жизни отрендеренной карточки поста в кэше, секунд
+POST_CARD_CACHE_TIMEOUT = 60 * 60
+
+# Кэш страниц лент для анонимных посетителей: срок жизни на сервере и
+# max-age для браузера (0 — всегда перепроверять)
+FEED_PAGE_CACHE_TIMEOUT = 60 * 60
+FEED_PAGE_MAX_AGE = 0
+
+# Превью картинок постов: размеры (геометрия и опции sorl) и число
+# фоновых потоков, которые их генерируют (0 — генерировать сразу)
+POST_THUMBNAILS = {
+    'feed': ('960x339', {'crop': 'center', 'upscale': True}),
 }
+THUMBNAIL_WORKERS = 0 if TESTING else 2
+# метаданные превью: LRU процесса перед кэшем и БД (см. posts.kvstore);
+# под тестами LRU пережил бы откат базы между тестами
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+THUMBNAIL_KVSTORE_LRU_SIZE = 0 if TESTING else 10000
+THUMBNAIL_KVSTORE_LRU_TIMEOUT = 60
+
+# Загрузка картинок постов (см. posts.images): лимиты до декодирования,
+# наибольшая сторона сохраняемого оригинала, формат и качество
+IMAGE_UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 40 * 1000 * 1000
+IMAGE_MAX_SIDE = 2048
+IMAGE_FORMAT = 'WEBP'
+IMAGE_QUALITY = 82
+# лимит размера проверяется ещё при приёме файла, см. posts.images
+FILE_UPLOAD_HANDLERS = [
+    'posts.images.UploadLimitHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Бюджет SQL-запросов на запрос по имени url (см. posts.middleware).
+# Превышение пишется в лог, а под тестами — исключение (QUERY_BUDGET_RAISE)
+QUERY_BUDGETS = {
+    'index': 6,
+    'group': 8,
+    'profile': 8,
+    'post': 8,
+    'follow_index': 6,
+    # +1 на BEGIN транзакции retry_on_busy
+    'add_comment': 9,
+    'search': 6,
+}
+QUERY_BUDGET_DEFAULT = None
+QUERY_BUDGET_RAISE = TESTING
+
+# Комментариев в одной порции на странице поста
+COMMENTS_PER_PAGE = 20
 
+# Размер порции строк при потоковой выгрузке (см. posts.export)
+EXPORT_CHUNK_SIZE = 2000
@@ -0,0 +1,54 @@
+"""Настройка SQLite для работы под нагрузкой.
+
+configure_connection выставляет SQLITE_PRAGMAS каждому новому соединению:
+WAL позволяет читать параллельно с записью, busy_timeout заставляет ждать
+освобождения блокировки, а не сразу падать с «database is locked».
+Соединения живут между запросами (CONN_MAX_AGE), так что PRAGMA
+выполняются один раз на соединение, а не на каждый запрос.
+
+Остаётся случай, который busy_timeout не лечит: транзакция начала с
+чтения, а к моменту записи базу уже держит другой писатель — SQLite
+возвращает ошибку сразу. Для него view записи оборачиваются в
+retry_on_busy: вся транзакция повторяется с экспоненциальной паузой.
+"""
+import logging
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+logger = logging.getLogger(__name__)
+
+BUSY_MESSAGES = ('database is locked', 'database table is locked', 'database is busy')
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_busy(error):
+    return any(message in str(error) for message in BUSY_MESSAGES)
+
+
+def retry_on_busy(view):
+    """Выполняет view в транзакции и повторяет её, пока база занята."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        attempts = settings.SQLITE_BUSY_RETRIES
+        for attempt in range(attempts + 1):
+            try:
+                with transaction.atomic():
+                    return view(request, *args, **kwargs)
+            except OperationalError as error:
+                if attempt == attempts or not is_busy(error):
+                    raise
+                delay = settings.SQLITE_BUSY_BACKOFF * 2 ** attempt
+                logger.info('База занята, повтор %s через %.3f с', view.__name__, delay)
+                time.sleep(delay * random.uniform(0.5, 1.5))
+    return wrapper
@@ -0,0 +1,37 @@
+"""Прогрев процесса перед первым запросом (вызывается из wsgi.py)."""
+import logging
+import os
+
+from django.conf import settings
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.utils import get_app_template_dirs
+
+logger = logging.getLogger(__name__)
+
+
+def template_names():
+    """Имена шаблонов проекта: DIRS и templates/ приложений из BASE_DIR."""
+    engine = engines['django'].engine
+    dirs = list(engine.dirs) + [
+        str(path) for path in get_app_template_dirs('templates')
+        if str(path).startswith(str(settings.BASE_DIR))
+    ]
+    for directory in dirs:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith('.html'):
+                    yield os.path.relpath(os.path.join(root, name), directory)
+
+
+def warm_templates():
+    """Компилирует шаблоны проекта в кэш загрузчика, возвращает их число."""
+    engine = engines['django']
+    loaded = 0
+    for name in template_names():
+        try:
+            engine.get_template(name.replace(os.sep, '/'))
+        except (TemplateDoesNotExist, TemplateSyntaxError) as error:
+            logger.warning('Шаблон %s не прогрет: %s', name, error)
+            continue
+        loaded += 1
+    return loaded
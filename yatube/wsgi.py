@@ -14,3 +14,16 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+# граф подписок загружаем сразу, а не на первом запросе
+from django.db import DatabaseError  # noqa: E402
+from posts.follow_graph import graph  # noqa: E402
+from yatube.warmup import warm_templates  # noqa: E402
+
+warm_templates()
+
+try:
+    graph.load()
+except DatabaseError:
+    # база ещё не создана (до migrate) — граф загрузится при первом обращении
+    pass